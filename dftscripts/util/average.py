@@ -0,0 +1,42 @@
+import numpy
+
+
+__all__ = [
+    "macroscopic_average",
+    "planar_average",
+    "plane_spacing",
+]
+
+
+# Average of 3d periodic data over the planes normal to one of its axes, e.g.
+# the plane-averaged density or potential along the stacking axis of a slab.
+# The average is accumulated in double precision in a single reduction.
+def planar_average(datain, axis=2):
+    datain = numpy.asarray(datain)
+    others = tuple(i for i in range(datain.ndim) if i != axis)
+    return numpy.mean(datain, axis=others, dtype=float)
+
+
+# Distance between the lattice planes of cell normal to the given axis, i.e. the
+# length of the axis projected on the normal of the plane of the other two
+def plane_spacing(cell, axis=2):
+    cell = numpy.array(cell, dtype=float)
+    others = [i for i in range(3) if i != axis]
+    normal = numpy.cross(cell[others[0]], cell[others[1]])
+    return abs(numpy.dot(cell[axis], normal)) / numpy.linalg.norm(normal)
+
+
+# Macroscopic average of a periodic profile of the given length: the running
+# average over a window of the given width, or over each of several widths in
+# turn (e.g. the two periods of a superlattice). The window is applied as a
+# convolution in Fourier space, where the average of the trigonometric
+# interpolant over a box of width w multiplies the k-th coefficient by
+# sinc(k w / length), so widths need not be a whole number of grid steps.
+def macroscopic_average(profile, length, width):
+    profile = numpy.asarray(profile, dtype=float)
+    n = profile.shape[-1]
+    k = numpy.arange(n // 2 + 1)
+    spectrum = numpy.fft.rfft(profile)
+    for w in numpy.atleast_1d(width):
+        spectrum *= numpy.sinc(k * w / float(length))
+    return numpy.fft.irfft(spectrum, n)
@@ -0,0 +1,162 @@
+import numpy
+from pymatgen.core.structure import Structure
+try:
+    from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+except ImportError:
+    # Name in older versions of pymatgen
+    from pymatgen.symmetry.finder import SymmetryFinder as SpacegroupAnalyzer
+
+
+__all__ = [
+    "StarInterpolator",
+    "point_group",
+]
+
+
+# Number of values of the star functions computed at once
+_BLOCK = 2 ** 22
+
+# Coefficients of the roughness of Pickett, Krakauer and Allen, PRB 38, 2721
+_C1 = _C2 = 0.75
+
+# Decimals to which k-points are rounded when comparing them
+_DECIMALS = 6
+
+
+# Integer code of rows of integers within [-bound, bound], equal for equal rows
+def _code(rows, bound):
+    rows = numpy.asarray(rows) + bound
+    base = 2 * bound + 1
+    return (rows[..., 0] * base + rows[..., 1]) * base + rows[..., 2]
+
+
+# Images of rows under every matrix of matrices, as rows times the matrix,
+# indexed [row, matrix], with a single matrix product
+def _rotate(rows, matrices):
+    images = numpy.dot(rows, numpy.asarray(matrices, dtype=float).transpose(1, 0, 2).reshape(3, -1))
+    images = images.reshape(len(rows), -1, 3)
+    if numpy.issubdtype(numpy.asarray(rows).dtype, numpy.integer):
+        return numpy.round(images).astype(int)
+    return images
+
+
+# Rotations of a crystal, as integer matrices W acting on direct coordinates
+# x -> W x (+ a translation): those of the symmetry operations that spglib
+# finds through the symmetry analyzer of pymatgen, with the lattice vectors as
+# rows of lattice and sites within symprec Angstrom of each other taken as equal.
+def point_group(lattice, frac_coords, species, symprec=0.01):
+    structure = Structure(numpy.array(lattice, dtype=float), [str(s) for s in species],
+                          numpy.array(frac_coords, dtype=float))
+    dataset = SpacegroupAnalyzer(structure, symprec=symprec).get_symmetry_dataset()
+    rotations = dataset['rotations'] if isinstance(dataset, dict) else dataset.rotations
+    # Cells larger than the primitive one repeat rotations with other translations
+    return numpy.unique(numpy.round(rotations).astype(int), axis=0)
+
+
+# Smooth Fourier interpolation of band energies known on a set of k-points, as
+# by Shankland, Koelling and Wood, with the roughness of Pickett, Krakauer and
+# Allen. The energies are expanded in star functions, sums of plane waves over
+# the stars of lattice vectors under the rotations of the crystal (see
+# point_group) and the inversion, which the bands have by time reversal, so the
+# interpolation has the symmetry of the crystal; it passes through the known
+# energies and minimizes the roughness in between.
+#
+# lattice holds the lattice vectors as rows, kpoints are in direct reciprocal
+# coordinates, e.g. the irreducible k-points of an SCF run (k-points related by
+# symmetry are used once), and energies is indexed [..., kpoint, band], e.g.
+# [spin, kpoint, band]. ratio is the number of star functions per k-point. All
+# the bands are fit and evaluated at once, with the same star functions.
+class StarInterpolator(object):
+    def __init__(self, lattice, kpoints, energies, rotations, ratio=5):
+        self.lattice = numpy.array(lattice, dtype=float)
+        rotations = numpy.asarray(rotations)
+        self.rotations = numpy.unique(numpy.concatenate([rotations, -rotations]), axis=0)
+        energies = numpy.asarray(energies, dtype=float)
+        self._shape = energies.shape[:-2] + energies.shape[-1:]
+
+        # Energies of the distinct k-points, one column per band
+        kpoints, unique = self._irreducible(numpy.asarray(kpoints, dtype=float))
+        energies = numpy.moveaxis(energies, -2, 0).reshape(energies.shape[-2], -1)[unique]
+        self.kpoints = kpoints
+        self._stars(ratio * len(kpoints))
+
+        # Interpolation through the last k-point, solving for the others
+        stars = self.star_functions(kpoints)
+        delta = stars[:-1, 1:] - stars[-1, 1:]
+        weighted = delta / self.roughness[1:]
+        coefficients = numpy.empty((self.nstars, energies.shape[1]))
+        try:
+            factors = numpy.linalg.solve(numpy.dot(weighted, delta.T), energies[:-1] - energies[-1])
+        except numpy.linalg.LinAlgError:
+            factors = numpy.linalg.lstsq(numpy.dot(weighted, delta.T), energies[:-1] - energies[-1], rcond=None)[0]
+        coefficients[1:] = numpy.dot(weighted.T, factors)
+        coefficients[0] = energies[-1] - numpy.dot(stars[-1, 1:], coefficients[1:])
+        self.coefficients = coefficients
+
+    # The k-points that are not related by a rotation to one before them, and
+    # their indices
+    def _irreducible(self, kpoints):
+        images = _rotate(kpoints, self.rotations)
+        images = numpy.round(images - numpy.floor(images), _DECIMALS) % 1.
+        bound = 10 ** _DECIMALS
+        codes = _code(numpy.round(images * bound).astype(numpy.int64), bound).max(axis=1)
+        _, unique = numpy.unique(codes, return_index=True)
+        unique.sort()
+        return kpoints[unique], unique
+
+    # The nstars shortest stars of lattice vectors, the vectors of every star
+    # and the roughness of their star functions
+    def _stars(self, nstars):
+        reciprocal = numpy.linalg.inv(self.lattice).T
+        volume = abs(numpy.linalg.det(self.lattice))
+        radius = (3. * nstars * len(self.rotations) * volume / (4. * numpy.pi)) ** (1. / 3.)
+        while True:
+            bounds = numpy.ceil(radius * numpy.sqrt((reciprocal ** 2).sum(axis=1))).astype(int)
+            vectors = numpy.array(numpy.meshgrid(*[numpy.arange(-b, b + 1) for b in bounds],
+                                                 indexing='ij')).reshape(3, -1).T
+            lengths = numpy.sqrt((numpy.dot(vectors, self.lattice) ** 2).sum(axis=1))
+            inside = lengths <= radius
+            vectors, lengths = vectors[inside], lengths[inside]
+
+            # Stars are labelled by the largest code of their vectors
+            images = _rotate(vectors, self.rotations.transpose(0, 2, 1))
+            bound = int(abs(images).max())
+            codes = _code(images, bound).max(axis=1)
+            order = numpy.lexsort((codes, numpy.round(lengths, _DECIMALS)))
+            vectors, lengths, codes = vectors[order], lengths[order], codes[order]
+            first = numpy.flatnonzero(numpy.concatenate([[True], codes[1:] != codes[:-1]]))
+            if len(first) > nstars:
+                break
+            radius *= 1.5
+
+        # Vectors of the stars kept; the star functions are real, so of the
+        # vectors R and -R only one is needed
+        end = first[nstars]
+        vectors, codes = vectors[:end], codes[:end]
+        star = numpy.repeat(numpy.arange(nstars), numpy.diff(numpy.append(first[:nstars], end)))
+        half = _code(vectors, bound) >= _code(-vectors, bound)
+        self.nstars = nstars
+        self._vectors = vectors[half]
+        self._first = numpy.flatnonzero(numpy.concatenate([[True], star[half][1:] != star[half][:-1]]))
+        self._count = numpy.diff(numpy.append(self._first, len(self._vectors)))
+
+        x = (lengths[first[:nstars]] / lengths[first[1]]) ** 2
+        self.roughness = (1. - _C1 * x) ** 2 + _C2 * x ** 3
+
+    # Star functions at kpoints (in direct reciprocal coordinates), indexed
+    # [kpoint, star], computed in blocks of kpoints
+    def star_functions(self, kpoints):
+        kpoints = numpy.asarray(kpoints, dtype=float)
+        out = numpy.empty((len(kpoints), self.nstars))
+        step = max(_BLOCK // len(self._vectors), 1)
+        for start in range(0, len(kpoints), step):
+            phase = numpy.cos(2. * numpy.pi * numpy.dot(kpoints[start:start + step], self._vectors.T))
+            out[start:start + step] = numpy.add.reduceat(phase, self._first, axis=1) / self._count
+        return out
+
+    # Interpolated energies at kpoints, indexed as the energies fit with the
+    # kpoints in place of the k-points, e.g. [spin, kpoint, band]
+    def __call__(self, kpoints):
+        energies = numpy.dot(self.star_functions(kpoints), self.coefficients)
+        energies = energies.reshape((len(energies),) + self._shape)
+        return numpy.moveaxis(energies, 0, -2)
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import shutil
+import numpy
+
+
+__all__ = [
+    "CACHE_DIR",
+    "CACHE_SIZE",
+    "ParseCache",
+    "input_fingerprint",
+    "open_cache",
+]
+
+
+# Where parsed arrays are kept, and how many bytes may be kept before the least
+# recently used entries are evicted. Both can be set from the environment.
+CACHE_DIR = os.environ.get('DFTSCRIPTS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'dftscripts'))
+CACHE_SIZE = int(float(os.environ.get('DFTSCRIPTS_CACHE_SIZE', 8e9)))
+
+# Number of bytes hashed at each end of a file
+_SAMPLE = 2 ** 20
+
+
+# Add the first and last MiB of a file of size bytes to digest
+def _sample(digest, filename, size):
+    with open(filename, 'rb') as f:
+        digest.update(f.read(_SAMPLE))
+        if size > 2 * _SAMPLE:
+            f.seek(-_SAMPLE, os.SEEK_END)
+            digest.update(f.read(_SAMPLE))
+
+
+# Fingerprint of a file from its path, size, modification time and a hash of
+# its first and last MiB. Hashing every byte of a multi-GB CHGCAR would cost as
+# much as parsing it, and VASP outputs differ in both the header and the tail.
+def _fingerprint(filename):
+    stat = os.stat(filename)
+    digest = hashlib.sha1()
+    digest.update(('%s\0%d\0%r\0' % (os.path.abspath(filename), stat.st_size, stat.st_mtime)).encode('utf-8'))
+    _sample(digest, filename, stat.st_size)
+    return digest.hexdigest()
+
+
+# Fingerprint of the inputs of a calculation: the content of the files, sampled
+# as above, and settings given as strings. Unlike the fingerprint of the parse
+# cache, it does not depend on where the files are or when they were written,
+# so that copies of the same inputs match.
+def input_fingerprint(filenames, settings=()):
+    digest = hashlib.sha1()
+    for filename in filenames:
+        size = os.path.getsize(filename)
+        digest.update(('%d\0' % size).encode('utf-8'))
+        _sample(digest, filename, size)
+    for setting in settings:
+        digest.update(('%s\0' % setting).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Total size in bytes of the files in a directory
+def _size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+# Cache of arrays parsed from output files such as vasprun.xml and CHGCAR.
+# Each entry is a directory named after the kind of data and the fingerprint
+# of the file it was parsed from, holding one .npy file per array so that large
+# grids can be memory mapped. Entries are touched when used, and the least
+# recently used ones are removed once the cache grows beyond max_size bytes.
+# Failures to read or write the cache are ignored; the caller then parses.
+class ParseCache(object):
+    def __init__(self, root=CACHE_DIR, max_size=CACHE_SIZE):
+        self.root = root
+        self.max_size = max_size
+
+    # Directory of the entry for data of the given kind parsed from filename
+    def _entry(self, filename, kind):
+        return os.path.join(self.root, '%s-%s' % (kind, _fingerprint(filename)))
+
+    # Dictionary of the arrays cached for filename, or None
+    def load(self, filename, kind, mmap_mode=None):
+        try:
+            path = self._entry(filename, kind)
+            if not os.path.isdir(path):
+                return None
+            arrays = dict((name[:-4], numpy.load(os.path.join(path, name), mmap_mode=mmap_mode))
+                          for name in os.listdir(path) if name.endswith('.npy'))
+            # Mark the entry as recently used
+            os.utime(path, None)
+        except (OSError, IOError, ValueError):
+            return None
+        return arrays
+
+    # Add arrays to the entry for filename, then evict old entries
+    def store(self, filename, kind, arrays):
+        try:
+            path = self._entry(filename, kind)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for name, array in arrays.items():
+                target = os.path.join(path, '%s.npy' % name)
+                temp = '%s.%d.tmp' % (target, os.getpid())
+                with open(temp, 'wb') as f:
+                    numpy.save(f, numpy.asanyarray(array))
+                os.rename(temp, target)
+            self.evict()
+        except (OSError, IOError):
+            return False
+        return True
+
+    # Remove the least recently used entries until the cache fits in max_size
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                entries.append((os.path.getmtime(path), _size(path), path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+# Cache used by the command line tools: True gives the default cache, False or
+# None disables caching, and a ParseCache is used as is.
+def open_cache(cache=True):
+    if cache is True:
+        return ParseCache()
+    return cache or None
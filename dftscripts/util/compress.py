@@ -0,0 +1,114 @@
+import threading
+import zlib
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+
+__all__ = [
+    "BLOCK",
+    "ParallelGzipWriter",
+    "gzip_background",
+    "gzip_file",
+]
+
+
+# Number of bytes compressed at a time by each thread
+BLOCK = 2 ** 24
+
+
+# Compress data as a complete gzip member. zlib releases the GIL while it
+# compresses, so members are compressed in parallel by threads.
+def _gzip_member(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+# Write-only file object producing a .gz file from blocks compressed by a pool
+# of threads. Each block is an independent gzip member; a file of concatenated
+# members is a standard gzip file, read by gzip, zcat and Python's gzip module.
+# At most two blocks per thread are held in memory.
+class ParallelGzipWriter(object):
+    def __init__(self, filename, level=6, workers=0, block=BLOCK):
+        self.level = level
+        self.block = block
+        self.workers = workers if workers > 0 else cpu_count()
+        self._file = open(filename, 'wb')
+        self._pool = ThreadPool(self.workers)
+        self._pending = deque()
+        self._buffer = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Write the compressed blocks that are done, or all of them
+    def _drain(self, everything=False):
+        while self._pending and (everything or len(self._pending) >= 2 * self.workers):
+            self._file.write(self._pending.popleft().get())
+
+    def _submit(self):
+        data = b''.join(self._buffer)
+        self._buffer, self._size = [], 0
+        self._pending.append(self._pool.apply_async(_gzip_member, (data, self.level)))
+        self._drain()
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self.block:
+            self._submit()
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self._size:
+                self._submit()
+            self._drain(everything=True)
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._file.close()
+
+
+# Compress the file source to target, reading it in blocks of block bytes that
+# are compressed in parallel by workers threads (0 uses every core)
+def gzip_file(source, target, level=6, workers=0, block=BLOCK):
+    with open(source, 'rb') as src, ParallelGzipWriter(target, level, workers, block) as dst:
+        data = src.read(block)
+        while data:
+            dst.write(data)
+            data = src.read(block)
+
+
+# gzip_file in a background thread, so that the caller can go on while the file
+# is compressed. Call wait() on the returned thread before using the target or
+# removing the source; it raises the error of the compression, if any.
+class _Background(threading.Thread):
+    def __init__(self, *args, **kwargs):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._args = args
+        self._kwargs = kwargs
+        self.error = None
+
+    def run(self):
+        try:
+            gzip_file(*self._args, **self._kwargs)
+        except Exception as e:
+            self.error = e
+
+    def wait(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+def gzip_background(source, target, level=6, workers=0, block=BLOCK):
+    thread = _Background(source, target, level=level, workers=workers, block=block)
+    thread.start()
+    return thread
@@ -0,0 +1,111 @@
+import numpy
+
+from .interpolate import CHUNK, _flatten, _map_tiles, _strides
+
+
+__all__ = [
+    "SiteIndex",
+]
+
+
+# Grid points (in C order) around the origin that may lie within radius of a
+# site anywhere inside the grid cell containing the origin
+def _box_offsets(shape, cell, radius):
+    # Extent of the sphere along each axis, in grid steps
+    extent = radius * numpy.linalg.norm(numpy.linalg.inv(cell), axis=0) * shape
+    axes = [numpy.arange(-e, e + 1) for e in numpy.ceil(extent).astype(int) + 1]
+    return numpy.array(numpy.meshgrid(*axes, indexing='ij')).reshape(3, -1).T
+
+
+# Index of the grid points belonging to each site of a structure, to integrate
+# the density (or any other grid of the same shape) around every site. With
+# radii, a site owns the points within a sphere of its radius (one radius for
+# every site or one per site, in Angstrom); points of overlapping spheres count
+# for every sphere they are in. Without radii, a site owns the points of its
+# Voronoi cell, i.e. those closer to it than to any other site; this needs
+# scipy. Periodic images are accounted for, so spheres and cells may cross the
+# boundary of the cell. The index depends only on the grid shape, the cell and
+# the sites, and is reused for every grid integrated.
+class SiteIndex(object):
+    def __init__(self, shape, cell, frac_coords, radii=None, workers=1):
+        self.shape = tuple(int(n) for n in shape)
+        self.cell = numpy.array(cell, dtype=float)
+        self.frac_coords = numpy.array(frac_coords, dtype=float)
+        self.radii = radii
+        nsites = len(self.frac_coords)
+        if radii is None:
+            # Site of every grid point, in C order
+            self._points = None
+            self._sites = self._voronoi(workers)
+        else:
+            radii = numpy.broadcast_to(numpy.array(radii, dtype=float), (nsites,))
+            self._points, self._sites = self._spheres(radii)
+        self.counts = numpy.bincount(self._sites, minlength=nsites)
+        self.voxel = abs(numpy.linalg.det(self.cell)) / numpy.prod(self.shape)
+        self.volumes = self.counts * self.voxel
+        # Indices for each memory layout of the grids, see _layout
+        self._layouts = dict()
+
+    # Flat C order indices of the points within each sphere and their sites
+    def _spheres(self, radii):
+        shape = numpy.array(self.shape)
+        strides = _strides(self.shape)
+        offsets = dict()
+        points, sites = [], []
+        for site, (frac, radius) in enumerate(zip(self.frac_coords, radii)):
+            if radius not in offsets:
+                offsets[radius] = _box_offsets(shape, self.cell, radius)
+            ijk = numpy.round(frac * shape).astype(int) + offsets[radius]
+            cart = numpy.dot(ijk / shape.astype(float) - frac, self.cell)
+            ijk = ijk[numpy.einsum('ij,ij->i', cart, cart) <= radius ** 2]
+            points.append(numpy.dot(ijk % shape, strides))
+            sites.append(numpy.full(len(ijk), site, dtype=numpy.intp))
+        return numpy.concatenate(points), numpy.concatenate(sites)
+
+    # Nearest site of every grid point, in C order. The sites and their images
+    # in the neighbouring cells are put in a k-d tree, queried CHUNK points at
+    # a time on a pool of workers threads.
+    def _voronoi(self, workers):
+        from scipy.spatial import cKDTree
+        nsites = len(self.frac_coords)
+        shifts = numpy.array(numpy.meshgrid(*[[-1, 0, 1]] * 3, indexing='ij')).reshape(3, -1).T
+        images = (numpy.mod(self.frac_coords, 1)[None, :, :] + shifts[:, None, :]).reshape(-1, 3)
+        tree = cKDTree(numpy.dot(images, self.cell))
+
+        shape = numpy.array(self.shape)
+        sites = numpy.empty(numpy.prod(shape), dtype=numpy.intp)
+
+        def query(start):
+            ijk = numpy.array(numpy.unravel_index(numpy.arange(start, min(start + CHUNK, len(sites))), self.shape))
+            _, nearest = tree.query(numpy.dot(ijk.T / shape.astype(float), self.cell))
+            sites[start:start + CHUNK] = nearest % nsites
+
+        _map_tiles(query, range(0, len(sites), CHUNK), workers)
+        return sites
+
+    # Flat indices of the points and their sites for grids with the given
+    # strides, converted from C order once per memory layout
+    def _layout(self, strides):
+        key = tuple(strides)
+        if key not in self._layouts:
+            if list(strides) == list(_strides(self.shape)):
+                self._layouts[key] = self._points, self._sites
+            elif self._points is None:
+                # Reorder the sites of every point as the grid is laid out in memory
+                order = numpy.argsort(strides)[::-1]
+                sites = self._sites.reshape(self.shape).transpose(order).ravel()
+                self._layouts[key] = None, sites
+            else:
+                ijk = numpy.unravel_index(self._points, self.shape)
+                self._layouts[key] = sum(i * s for i, s in zip(ijk, strides)), self._sites
+        return self._layouts[key]
+
+    # Integral of datain, a grid of the index's shape, over the region of each
+    # site: the sum of the values of its points times the volume of a point
+    def integrate(self, datain):
+        datain = numpy.asarray(datain)
+        assert datain.shape == self.shape
+        flat, strides = _flatten(datain)
+        points, sites = self._layout(strides)
+        values = flat if points is None else flat[points]
+        return numpy.bincount(sites, weights=values, minlength=len(self.frac_coords)) * self.voxel
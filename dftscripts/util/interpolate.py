@@ -1,11 +1,34 @@
+import copy
+import threading
 import numpy
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 
 __all__ = [
+    "CACHE_BYTES",
+    "CHUNK",
+    "METHODS",
+    "interpolate_line",
     "interpolate_plane",
+    "interpolate_volume",
+    "PlaneSampler",
 ]
 
 
+# Supported interpolation orders
+METHODS = ('linear', 'cubic', 'fourier')
+
+# Upper bound on the number of complex numbers held at once by the Fourier sum
+_FOURIER_BLOCK = 2 ** 22
+
+# Default number of points interpolated at once by interpolate_plane
+CHUNK = 2 ** 16
+
+# Default number of bytes of stencils a PlaneSampler keeps between calls
+CACHE_BYTES = 2 ** 30
+
+
 # Convert two vectors into a normalzied coordinate system via GS orthogonalization
 def plane_to_cs(cs):
     # Normalize vectors
@@ -17,127 +40,469 @@ def plane_to_cs(cs):
     return numpy.vstack([cs, numpy.cross(cs[0], cs[1])])
 
 
-# Genreate a grid on a 2d plane in 3d space
-def _grid_intersection(plane, res, dim):
-    # Create grid
-    x, y, z = numpy.mgrid[0:res[0], 0:res[1], 0.:1.]
-    # Center grid
-    x -= numpy.floor(res[0]/2)
-    y -= numpy.floor(res[1]/2)
-    # Scale grid
-    x *= 1.*dim[0]/res[0]
-    y *= 1.*dim[1]/res[1]
-    # List of points in the grid
-    element = numpy.array([x.flatten(), y.flatten(), z.flatten()])
-    # Generate coordinate system
-    cs = plane_to_cs(plane)
-    # Rotate points to plane cs
-    return x, y, numpy.dot(element.T, cs)
+# Coordinates of a centered grid along each of its axes
+def _box_axes(res, dim):
+    axes = []
+    for n, length in zip(res, dim):
+        # Create and center grid
+        x = numpy.arange(n, dtype=float)
+        x -= numpy.floor(n/2)
+        # Scale grid
+        x *= 1.*length/n
+        axes.append(x)
+    return axes
 
 
-# Interpolate regularly spaced periodic nd data at an arbitrary point.
-def _pinterpn(datain, rr):
-    # Grid dimensions. e.g. [100,100,100]
-    grid = datain.shape
+# Indices and weights of the two grid points that bracket each position along
+# one periodic axis. x is the position in units of the grid spacing and n is
+# the number of grid points along the axis.
+def _linear_taps(x, n):
+    # Lower corner and distance from it
+    i = numpy.floor(x)
+    t = x - i
+    # Wrap the lower and upper corners back into the grid
+    i = i.astype(numpy.intp) % n
+    return numpy.array([i, (i + 1) % n]), numpy.array([1 - t, t])
+
+
+# Indices and weights of the four grid points supporting a periodic cubic
+# B-spline at each position along one axis.
+def _cubic_taps(x, n):
+    i = numpy.floor(x)
+    t = x - i
+    i = i.astype(numpy.intp)
+    s = 1 - t
+    weights = numpy.array([s ** 3,
+                           3 * t ** 3 - 6 * t ** 2 + 4,
+                           -3 * t ** 3 + 3 * t ** 2 + 3 * t + 1,
+                           t ** 3]) / 6.
+    return numpy.array([(i + k) % n for k in (-1, 0, 1, 2)]), weights
+
+
+# Floating point type that data of type dtype is interpolated in. Single
+# precision stays single precision, anything else is promoted to double.
+def _float_type(dtype):
+    return numpy.promote_types(numpy.empty(0, dtype).real.dtype, numpy.float32)
+
+
+# Distance between neighbouring points of the flattened grid along each axis
+def _strides(grid):
+    return numpy.cumprod((tuple(grid[1:]) + (1,))[::-1])[::-1]
+
+
+# Flat view of a grid in its own memory order and the distance between
+# neighbouring points along each axis, so that C and Fortran ordered grids
+# (e.g. memory mapped ones) are used without a copy.
+def _flatten(datain):
+    if not (datain.flags.c_contiguous or datain.flags.f_contiguous):
+        datain = numpy.ascontiguousarray(datain)
+    return datain.ravel(order='K'), [s // datain.itemsize for s in datain.strides]
+
+
+# Combine per-axis tap indices into flat indices for every corner of the box
+# around each point, with shape (ncorners, npoints) so that each corner is a
+# contiguous row.
+def _flat_index(indices, strides):
+    npoints = indices[0].shape[1]
+    index = numpy.zeros((1, npoints), dtype=numpy.intp)
+    for i, stride in zip(indices, strides):
+        index = (index[:, None, :] + stride * i[None, :, :]).reshape(-1, npoints)
+    return index
+
+
+# Combine per-axis tap weights into the weight of every corner, in the same
+# order as _flat_index. The weights are computed in double precision and
+# rounded to dtype.
+def _tap_weights(weights, dtype=float):
+    npoints = weights[0].shape[1]
+    weight = numpy.ones((1, npoints))
+    for w in weights:
+        weight = (weight[:, None, :] * w[None, :, :]).reshape(-1, npoints)
+    return weight.astype(dtype, copy=False)
+
+
+# Combine per-axis taps into flat indices and weights for every corner
+def _stencil(taps, strides, dtype=float):
+    return _flat_index([i for i, _ in taps], strides), _tap_weights([w for _, w in taps], dtype)
+
+
+# Per-axis taps of the points rr, given in direct coordinates between 0 and 1
+def _locate(grid, rr, method='linear'):
+    # Scale the points to the size of the grid
+    rr = rr * grid
+    taps = _cubic_taps if method == 'cubic' else _linear_taps
+    return [taps(rr[:, d], grid[d]) for d in range(len(grid))]
+
+
+# Weighted sum of the grid values at the stencil corners
+def _gather(flat, index, weight):
+    data = flat[index[0]] * weight[0]
+    for i, w in zip(index[1:], weight[1:]):
+        data += flat[i] * w
+    return data
+
+
+# Periodic cubic B-spline coefficients of the grid. The spline built from these
+# coefficients passes through every grid point. The B-spline filter is diagonal
+# in Fourier space, so the coefficients are obtained with a single FFT.
+def _spline_coefficients(datain):
+    spectrum = numpy.fft.rfftn(datain)
+    last = datain.ndim - 1
+    for axis, n in enumerate(datain.shape):
+        k = numpy.fft.rfftfreq(n) if axis == last else numpy.fft.fftfreq(n)
+        shape = [1] * datain.ndim
+        shape[axis] = -1
+        spectrum /= ((4 + 2 * numpy.cos(2 * numpy.pi * k)) / 6).reshape(shape)
+    return numpy.fft.irfftn(spectrum, datain.shape).astype(_float_type(datain.dtype), copy=False)
+
+
+# Fourier coefficients of the grid for trigonometric interpolation. Only the
+# non-negative frequencies of the last axis are kept, so the negative ones are
+# folded onto them by doubling.
+def _fourier_coefficients(datain):
+    spectrum = numpy.fft.rfftn(datain) / datain.size
+    n = datain.shape[-1]
+    spectrum[..., 1:(n + 1) // 2] *= 2
+    return spectrum.astype(numpy.result_type(_float_type(datain.dtype), numpy.complex64), copy=False)
+
+
+# Plane waves exp(2 pi i k x) for all frequencies k of a periodic axis with n
+# points, evaluated at fractional positions x. half selects the non-negative
+# frequencies of a real FFT axis. The Nyquist frequency of a full axis is split
+# evenly between +n/2 and -n/2, which gives a cosine.
+def _fourier_phases(x, n, half=False):
+    k = numpy.fft.rfftfreq(n, 1. / n) if half else numpy.fft.fftfreq(n, 1. / n)
+    phases = numpy.exp(2j * numpy.pi * numpy.outer(x, k))
+    if not half and n % 2 == 0:
+        phases[:, n // 2] = numpy.cos(numpy.pi * n * x)
+    return phases
+
+
+# Evaluate the trigonometric interpolant at fractional positions rr. The sum
+# over frequencies is contracted one axis at a time, in blocks of points that
+# keep the intermediate arrays bounded. The sum is accumulated in double
+# precision whatever the precision of the spectrum.
+def _fourier_sum(spectrum, grid, rr):
+    npoints, dim = rr.shape
+    rest = spectrum.size // spectrum.shape[0]
+    block = max(1, _FOURIER_BLOCK // rest)
+    data = numpy.empty(npoints, dtype=_float_type(spectrum.dtype))
+    for start in range(0, npoints, block):
+        r = rr[start:start + block]
+        phases = [_fourier_phases(r[:, d], grid[d], half=(d == dim - 1)) for d in range(dim)]
+        partial = numpy.dot(phases[0], spectrum.reshape(spectrum.shape[0], -1))
+        for phase in phases[1:]:
+            partial = numpy.einsum('pkr,pk->pr', partial.reshape(len(r), phase.shape[1], -1), phase)
+        data[start:start + block] = partial[:, 0].real
+    return data
+
+
+# Coefficients that the interpolation of the given order is evaluated from
+def _prepare(datain, method='linear'):
+    if method == 'linear':
+        return datain
+    if method == 'cubic':
+        return _spline_coefficients(datain)
+    if method == 'fourier':
+        return _fourier_coefficients(datain)
+    raise ValueError('Unknown interpolation method: %s' % method)
+
+
+# Interpolate regularly spaced periodic nd data at arbitrary points, given the
+# coefficients returned by _prepare and the shape of the original grid.
+def _evaluate(coefficients, grid, rr, method='linear'):
     # Number of grid dimensions. e.g. 3
     dim = len(grid)
-    # Number of points to interpolate. e.g. rr is 100x3
-    nelem = rr.shape[0]
-    # Dimension of points should agree with grid dimension. 
+    # Dimension of points should agree with grid dimension.
     assert rr.shape[1] == dim
     # Force rr to be between 0 and 1
-    rr = numpy.mod(numpy.mod(rr, 1) + 1, 1)
-    
-    # allocate space for the results
-    data = numpy.zeros((nelem, 1), dtype=datain.dtype)
-
-    # dimmatrix is a nelem list of the grid dimentions.
-    # Ex: [[100,100,100],
-    #      [100,100,100],
-    #      ...
-    #      [100,100,100]]
-    dimmatrix = numpy.tile(grid, (nelem, 1))
-
-    # ir and pr are zero-indexed integers that define two opposite corners of an
-    # n-dimensional box with density points defined at all of the corners given
-    # by datain. First, scale rr points to the size of the grid and then round
-    # to smallest integer to define the "lower corner".
-    ir = numpy.fix(numpy.dot(rr, numpy.diag(grid)))
-    # Find the "higher corner" by adding 1 to each lower corner and then wrapping
-    # the edges back to zero
-    pr = numpy.mod(ir + 1, dimmatrix)
-    # Check if any upper corners are on the boundary,
-    idx = (pr == dimmatrix)
-    # and wrap the boundary points back to zero.
-    pr[idx] -= dimmatrix[idx]
-    # xr is a vector from the lower corner of a box to the position of
-    # the interpolation point.
-    xr = numpy.dot(rr, numpy.diag(grid)) - ir
-    
-    # Iterator over the 2^d corners of each box
-    corners = range(2 ** dim)
-    
-    # Iterator over the dimensions of the space
-    dims = range(dim)
-    
-    # Distance to nearest edge in each dimension. Initialize to zero
-    r = dim * [0]
-    
-    # Lower and upper corners
-    ir = numpy.array([ir, pr])
-    # Distance weight factors on lower and upper corners
-    xr = numpy.array([1 - xr, xr])
-    
-    # Loop over each position
-    for j in range(nelem):
-        # Initialize density value to zero
-        denval = 0
-        # Loop over each corner
-        # Add up the contribution from each corner weighted 
-        # by the distance to that corner
-        for corner in corners:
-            x = 1
-            # loop over each dimension
-            for dim in dims:
-
-                # determine if this corner is low or high,
-                lohi = corner % 2
-                # and remove last bit.
-                corner /= 2
-                
-                # distance weight factor
-                x *= xr[lohi, j, dim]
-                
-                # nearest edge
-                r[dim] = ir[lohi, j, dim]
-
-            denval += x * datain[tuple(r)]
-        data[j] = denval
-    return data
+    rr = numpy.mod(rr, 1)
+    if method == 'fourier':
+        return _fourier_sum(coefficients, grid, rr)
+    # Grid points and their weights along each dimension
+    taps = _locate(grid, rr, method)
+    # Add up the contribution from each corner weighted by the distance to that corner
+    flat, strides = _flatten(coefficients)
+    index, weight = _stencil(taps, strides, _float_type(coefficients.dtype))
+    return _gather(flat, index, weight)
 
 
-# Linearlly interpolate 3d periodic data on a plane grid
-def interpolate_plane(datain, cell=((1., 0., 0.), (0., 1., 0.), (0., 0., 1.)),
-                      plane=((1., 0., 0.), (0., 0., 1.)), center=(0.5, 0.5, 0.5),
-                      dim=(1., 1.), res=(100., 100.)):
+# Interpolate regularly spaced periodic nd data at an arbitrary point.
+def _pinterpn(datain, rr, method='linear'):
+    return _evaluate(_prepare(datain, method), datain.shape, rr, method)
+
+
+# Fill out tile by tile with the interpolation at Cartesian points. points(i, j)
+# returns the Cartesian coordinates for out[i:j], and each tile holds whole
+# slices along the first axis of out with about chunk points in total. With
+# more than one worker the tiles are shared out to a thread pool; the NumPy
+# kernels release the GIL and every tile is computed exactly as in the serial
+# loop, so the result does not depend on the number of workers.
+def _interpolate_tiles(coefficients, grid, method, cell, center, points, out, chunk, workers=1):
+    # Map Cartesian coordinates to primitive cell coordinates
+    inv = numpy.linalg.inv(cell)
+    rows = max(1, int(chunk) * out.shape[0] // max(1, out.size))
+
+    def tile(start):
+        # Rotate points to primitive cell coordinates
+        rr = numpy.dot(points(start, start + rows).reshape(-1, 3), inv)
+        # Add the center point to all elements
+        rr += center
+        # Interpolate the density on the tile
+        values = _evaluate(coefficients, grid, rr, method)
+        out[start:start + rows] = values.reshape(out[start:start + rows].shape)
+
+    _map_tiles(tile, range(0, out.shape[0], rows), workers)
+    return out
+
+
+# Call tile(start) for every start, in order or shared out to a thread pool of
+# workers threads (0 uses every core)
+def _map_tiles(tile, starts, workers=1):
+    if workers is None or workers == 1 or len(starts) < 2:
+        for start in starts:
+            tile(start)
+        return
+    pool = ThreadPool(workers if workers > 0 else cpu_count())
+    try:
+        pool.map(tile, starts)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# Interpolate 3d periodic data on a box spanned by the Cartesian axes cs, e.g.
+# the 2 in-plane axes of a plane or 3 axes of a rotated sub-volume.
+def _interpolate_box(datain, cell, cs, center, dim, res, method, chunk, out, workers):
     # Convert to numpy
     cell = numpy.array(cell)
     center = numpy.array(center)
-    plane = numpy.array(plane)
-    datain = numpy.array(datain)
+    datain = numpy.asarray(datain)
+    res = [int(n) for n in res]
+    if out is None:
+        out = numpy.empty(res, dtype=_float_type(datain.dtype))
+    assert list(out.shape) == res
     # Define the cell size
     boxsize = max(sum(abs(cell)))
-    # Generate grid in Cartesian coordinates
-    x, y, elements = _grid_intersection(plane, res, dim)
-    # Scale the coordinates to the size of the box
-    x *= boxsize
-    y *= boxsize
-    elements *= boxsize
-    # Rotate points to primitive cell coordinates
-    rr = numpy.linalg.solve(cell.T, elements.T)
-    # Add the center point to all elements
-    rr += numpy.array([center]).T.repeat(rr.shape[1], 1)
-    # Interpolate the density on the plane
-    dataout = numpy.reshape(_pinterpn(datain, rr.T), res)
+    # Generate grid axes in Cartesian coordinates, scaled to the size of the box
+    axes = _box_axes(res, dim)
+    for x in axes:
+        x *= boxsize
+
+    # Points of out[i:j] in Cartesian coordinates
+    def points(i, j):
+        elements = 0
+        for n, (x, direction) in enumerate(zip(axes, cs)):
+            x = x[i:j] if n == 0 else x
+            shape = [1] * (len(axes) + 1)
+            shape[n] = -1
+            elements = elements + x.reshape(shape) * direction
+        return elements
+
+    _interpolate_tiles(_prepare(datain, method), datain.shape, method, cell, center, points, out, chunk, workers)
+    # Return the grid axes broadcast to the shape of the data
+    grids = []
+    for n, x in enumerate(axes):
+        shape = [1] * len(axes)
+        shape[n] = -1
+        grids.append(numpy.broadcast_to(x.reshape(shape), res))
+    return grids + [out]
+
+
+# Interpolate 3d periodic data on a plane grid. method is one of METHODS:
+# 'linear' (trilinear), 'cubic' (periodic cubic B-spline through the grid
+# points) or 'fourier' (exact trigonometric interpolation). The cost of the
+# Fourier sum grows with the number of grid points, so it is meant for coarse grids.
+#
+# The plane is processed in tiles of whole rows holding about chunk points, so
+# the temporary arrays scale with the tile rather than the plane. The result is
+# written into out when given, which may be a numpy.memmap (for instance from
+# numpy.lib.format.open_memmap) to stream the plane straight to disk. workers
+# sets the number of threads the tiles are shared out to (0 uses every core);
+# the result is identical to the serial one.
+#
+# Single precision (float32) data is interpolated and returned in single
+# precision without copying the grid. The stencil weights are computed in
+# double precision and rounded, and the Fourier sum is accumulated in double
+# precision, so the result differs from the float64 path by less than about
+# 1e-6 of max |datain| (a few float32 roundings of each term); in practice
+# this is below the rounding of the float32 grid itself.
+def interpolate_plane(datain, cell=((1., 0., 0.), (0., 1., 0.), (0., 0., 1.)),
+                      plane=((1., 0., 0.), (0., 0., 1.)), center=(0.5, 0.5, 0.5),
+                      dim=(1., 1.), res=(100., 100.), method='linear', chunk=CHUNK, out=None,
+                      workers=1):
+    # Generate coordinate system
+    cs = plane_to_cs(numpy.array(plane, dtype=float))
     # Return x,y,z data
-    return x[:, :, 0], y[:, :, 0], dataout
+    return tuple(_interpolate_box(datain, cell, cs[:2], center, dim, res, method, chunk, out, workers))
+
+
+# Interpolate 3d periodic data on a rotated sub-volume. The x and y axes of the
+# box lie in plane, as for interpolate_plane, and the z axis is normal to it.
+# Returns the x, y and z coordinates and the data on a grid of shape res.
+def interpolate_volume(datain, cell=((1., 0., 0.), (0., 1., 0.), (0., 0., 1.)),
+                       plane=((1., 0., 0.), (0., 0., 1.)), center=(0.5, 0.5, 0.5),
+                       dim=(1., 1., 1.), res=(50., 50., 50.), method='linear', chunk=CHUNK, out=None,
+                       workers=1):
+    # Generate coordinate system
+    cs = plane_to_cs(numpy.array(plane, dtype=float))
+    return tuple(_interpolate_box(datain, cell, cs, center, dim, res, method, chunk, out, workers))
+
+
+# Interpolate 3d periodic data on res evenly spaced points along the line from
+# start to end, both included and given in direct (fractional) coordinates.
+# Returns the Cartesian distance from start and the data at each point.
+def interpolate_line(datain, cell=((1., 0., 0.), (0., 1., 0.), (0., 0., 1.)),
+                     start=(0., 0., 0.), end=(0., 0., 1.), res=100, method='linear', chunk=CHUNK, out=None,
+                     workers=1):
+    # Convert to numpy
+    cell = numpy.array(cell)
+    start = numpy.array(start, dtype=float)
+    datain = numpy.asarray(datain)
+    res = int(res)
+    if out is None:
+        out = numpy.empty(res, dtype=_float_type(datain.dtype))
+    assert out.shape == (res,)
+    # Cartesian vector along the line and distance of each point from start
+    direction = numpy.dot(numpy.array(end, dtype=float) - start, cell)
+    t = numpy.linspace(0., 1., res)
+    distance = t * numpy.linalg.norm(direction)
+
+    # Points of out[i:j] in Cartesian coordinates, relative to start
+    def points(i, j):
+        return t[i:j, None] * direction
+
+    _interpolate_tiles(_prepare(datain, method), datain.shape, method, cell, start, points, out, chunk, workers)
+    return distance, out
+
+
+# Interpolation of 3d periodic data on a fixed plane grid, for sweeping many
+# planes, spin channels or files with grids of the same shape. The geometry and
+# the stencil (grid indices and weights of every point) are computed once, so
+# applying the sampler to data is a gather and weighted sum. As in
+# interpolate_plane, the stencil is built and applied in tiles of whole rows
+# holding about chunk points, shared out to workers threads (0 uses every core).
+# Tiles are built on the first call and kept as long as they fit in cache_bytes,
+# which bounds the memory of the sampler; the others are built again on every
+# call. shift() moves the plane to another center, e.g. to march a stack of
+# planes along c. Shifts by whole grid steps reuse the cached weights and only
+# offset the indices. The weights are stored in dtype, the precision of the
+# data it is applied to.
+#
+#     sampler = PlaneSampler(data.shape, cell, plane=plane, center=center)
+#     up, down = sampler(data_up), sampler(data_down)
+#     stack = [sampler.shift(center + [0, 0, 1. * i / data.shape[2]])(data) for i in range(data.shape[2])]
+class PlaneSampler(object):
+    def __init__(self, shape, cell=((1., 0., 0.), (0., 1., 0.), (0., 0., 1.)),
+                 plane=((1., 0., 0.), (0., 0., 1.)), center=(0.5, 0.5, 0.5),
+                 dim=(1., 1.), res=(100., 100.), method='linear', dtype=float, chunk=CHUNK, workers=1,
+                 cache_bytes=CACHE_BYTES):
+        if method not in METHODS:
+            raise ValueError('Unknown interpolation method: %s' % method)
+        self.shape = tuple(int(n) for n in shape)
+        self.res = [int(n) for n in res]
+        self.method = method
+        self.dtype = _float_type(dtype)
+        self.chunk = chunk
+        self.workers = workers
+        self.cache_bytes = cache_bytes
+        cell = numpy.array(cell)
+        # Generate coordinate system
+        cs = plane_to_cs(numpy.array(plane, dtype=float))
+        # Generate grid axes in Cartesian coordinates, scaled to the size of the box
+        boxsize = max(sum(abs(cell)))
+        x, y = _box_axes(self.res, dim)
+        x *= boxsize
+        y *= boxsize
+        self.x = numpy.broadcast_to(x[:, None], self.res)
+        self.y = numpy.broadcast_to(y[None, :], self.res)
+        # Points of the plane in primitive cell coordinates, relative to the center
+        elements = x[:, None, None] * cs[0] + y[None, :, None] * cs[1]
+        self._offsets = numpy.dot(elements.reshape(-1, 3), numpy.linalg.inv(cell))
+        self._bind(center)
+
+    # Direct coordinates of the points of the plane around center, and an empty
+    # cache of tiles
+    def _bind(self, center, source=None):
+        self.center = numpy.array(center, dtype=float)
+        self._rr = numpy.mod(self._offsets + self.center, 1)
+        # Sampler and whole grid steps the tiles are offset from
+        self._source = source
+        self._tiles = dict()
+        self._cached = 0
+        self._lock = threading.Lock()
+
+    # Sampler for the same plane around another center
+    def shift(self, center):
+        sampler = copy.copy(self)
+        center = numpy.array(center, dtype=float)
+        steps = (center - self.center) * self.shape
+        if self.method != 'fourier' and numpy.allclose(steps, numpy.round(steps), rtol=0., atol=1e-8):
+            steps = numpy.round(steps).astype(numpy.intp)
+            source = self
+            if self._source is not None:
+                source, offset = self._source
+                steps += offset
+            sampler._bind(center, (source, steps))
+        else:
+            sampler._bind(center)
+        return sampler
+
+    # Stencil of the rows start to start + rows of the plane on a grid with
+    # strides: the per-axis tap indices, the strides, and the flat indices and
+    # weights of the corners. A tile of a shifted sampler is the one of its
+    # source with the indices offset.
+    def _tile(self, start, rows, strides):
+        tile = self._tiles.get(start)
+        if tile is not None and tile[1] == strides:
+            return tile
+        if tile is not None:
+            # The cached tile indexes grids of another memory order
+            indices, weight = tile[0], tile[3]
+        elif self._source is not None:
+            source, steps = self._source
+            indices, _, _, weight = source._tile(start, rows, strides)
+            indices = [(i + step) % n for i, step, n in zip(indices, steps, self.shape)]
+        else:
+            ny = self.res[1]
+            taps = _locate(self.shape, self._rr[start * ny:(start + rows) * ny], self.method)
+            indices, weight = [i for i, _ in taps], _tap_weights([w for _, w in taps], self.dtype)
+        index = _flat_index(indices, strides)
+        if numpy.prod(self.shape) <= numpy.iinfo(numpy.int32).max:
+            # Halves the memory of the cached indices, at the same speed of the gather
+            index = index.astype(numpy.int32)
+        tile = (indices, strides, index, weight)
+
+        size = sum(i.nbytes for i in indices) + index.nbytes + weight.nbytes
+        with self._lock:
+            if start in self._tiles:
+                del self._tiles[start]
+                self._cached -= size
+            if self._cached + size <= self.cache_bytes:
+                self._tiles[start] = tile
+                self._cached += size
+        return tile
+
+    # Interpolate datain, a grid of the sampler's shape, on the plane
+    def __call__(self, datain, out=None):
+        datain = numpy.asarray(datain)
+        assert datain.shape == self.shape
+        coefficients = _prepare(datain, self.method)
+        if out is None:
+            out = numpy.empty(self.res, dtype=numpy.result_type(_float_type(datain.dtype), self.dtype))
+        assert list(out.shape) == self.res
+        flat, strides = _flatten(coefficients)
+        strides = tuple(strides)
+        ny = self.res[1]
+        rows = max(1, int(self.chunk) // max(1, ny))
+
+        def tile(start):
+            if self.method == 'fourier':
+                values = _fourier_sum(coefficients, self.shape, self._rr[start * ny:(start + rows) * ny])
+            else:
+                _, _, index, weight = self._tile(start, rows, strides)
+                values = _gather(flat, index, weight)
+            out[start:start + rows] = values.reshape(-1, ny)
+
+        _map_tiles(tile, range(0, self.res[0], rows), self.workers)
+        return out
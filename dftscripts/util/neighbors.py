@@ -0,0 +1,62 @@
+import numpy
+
+
+__all__ = [
+    "plane_sites",
+]
+
+
+# Periodic images of the sites of a crystal that lie in a slab around a plane:
+# within depth of the plane and inside window = (xmin, xmax, ymin, ymax), in the
+# plane coordinates of the orthonormal axes cs (x, y and the normal, see
+# plane_to_cs) centered on center, given in direct coordinates.
+#
+# The lattice vector most normal to the plane is used as the column axis of a
+# cell list: for every site and every translation along the two other lattice
+# vectors that can reach the window, the translations along the column axis
+# that put the site within the slab are solved for directly, so the work grows
+# with the area of the window rather than with the volume of its bounding box.
+#
+# Returns the index of the site of every image, its lattice translation and its
+# (x, y, z) plane coordinates.
+def plane_sites(cell, frac_coords, cs, center, window, depth=0.5):
+    cell = numpy.array(cell, dtype=float)
+    cs = numpy.array(cs, dtype=float)
+    frac = numpy.array(frac_coords, dtype=float) - center
+    xmin, xmax, ymin, ymax = window
+
+    # Sites and lattice vectors in plane coordinates
+    positions = numpy.dot(numpy.dot(frac, cell), cs.T)
+    lattice = numpy.dot(cell, cs.T)
+
+    # Range of translations along each lattice vector that can reach the slab
+    corners = numpy.array([[x, y, z] for x in (xmin, xmax) for y in (ymin, ymax) for z in (-depth, depth)])
+    reach = numpy.dot(corners, numpy.linalg.inv(lattice))
+    low = numpy.floor(reach.min(axis=0) - frac.max(axis=0)).astype(int)
+    high = numpy.ceil(reach.max(axis=0) - frac.min(axis=0)).astype(int)
+
+    column = numpy.argmax(abs(lattice[:, 2]))
+    i, j = [axis for axis in range(3) if axis != column]
+    si, sj = numpy.meshgrid(numpy.arange(low[i], high[i] + 1), numpy.arange(low[j], high[j] + 1), indexing='ij')
+    si, sj = si.ravel(), sj.ravel()
+
+    # Height above the plane of every site translated along the two other vectors
+    z0 = positions[:, None, 2] + si[None, :] * lattice[i, 2] + sj[None, :] * lattice[j, 2]
+    step = lattice[column, 2]
+    bounds = numpy.sort([(-depth - z0) / step, (depth - z0) / step], axis=0)
+    first = numpy.ceil(bounds[0]).astype(int)
+    count = numpy.maximum(numpy.floor(bounds[1]).astype(int) - first + 1, 0).ravel()
+
+    # One entry per image within the slab
+    pair = numpy.repeat(numpy.arange(count.size), count)
+    sites, translation = numpy.divmod(pair, si.size)
+    shifts = numpy.zeros((pair.size, 3), dtype=int)
+    shifts[:, i] = si[translation]
+    shifts[:, j] = sj[translation]
+    shifts[:, column] = first.ravel()[pair] + numpy.arange(pair.size) - numpy.repeat(numpy.cumsum(count) - count,
+                                                                                          count)
+    images = positions[sites] + numpy.dot(shifts, lattice)
+
+    inside = (images[:, 0] >= xmin) & (images[:, 0] <= xmax) & (images[:, 1] >= ymin) & (images[:, 1] <= ymax) \
+        & (abs(images[:, 2]) <= depth)
+    return sites[inside], shifts[inside], images[inside]
@@ -0,0 +1,77 @@
+import os
+import numpy
+
+from .compress import ParallelGzipWriter
+
+
+__all__ = [
+    "FORMATS",
+    "output_filename",
+    "write_array",
+]
+
+
+# Output file formats: text (as numpy.savetxt), gzip compressed text, numpy
+# .npy, compressed numpy .npz and chunked, compressed HDF5 (needs h5py)
+FORMATS = ('text', 'gzip', 'npy', 'npz', 'hdf5')
+
+# Extension replacing the one of the text file name for each binary format
+_EXTENSIONS = dict(npy='.npy', npz='.npz', hdf5='.h5')
+
+# Number of rows formatted at once when writing text
+_ROWS = 2 ** 14
+
+
+# Name of the file written for a text file name in the given format
+def output_filename(filename, file_format='text'):
+    if file_format == 'text':
+        return filename
+    if file_format == 'gzip':
+        return filename + '.gz'
+    if file_format in _EXTENSIONS:
+        return os.path.splitext(filename)[0] + _EXTENSIONS[file_format]
+    raise ValueError('Unknown file format: %s' % file_format)
+
+
+# Write a 1d or 2d array as text, as numpy.savetxt does. Rows are formatted in
+# blocks with a single string operation instead of one call per row.
+def _write_text(f, array, header, fmt, delimiter):
+    array = numpy.asarray(array)
+    if array.ndim == 1:
+        array = array[:, None]
+    if header:
+        f.write(('# ' + header.replace('\n', '\n# ') + '\n').encode('latin1'))
+    row = delimiter.join([fmt] * array.shape[1]) + '\n'
+    for start in range(0, array.shape[0], _ROWS):
+        block = array[start:start + _ROWS]
+        f.write(((row * block.shape[0]) % tuple(block.ravel().tolist())).encode('latin1'))
+
+
+# Write array to filename (a text file name, e.g. bands.csv) in one of FORMATS,
+# and return the name of the file written. names optionally labels the columns
+# of a 2d array, which are then stored as separate arrays in npz and hdf5 files.
+def write_array(filename, array, header='', file_format='text', fmt='%.18e', delimiter=',', names=None):
+    filename = output_filename(filename, file_format)
+    if file_format == 'text':
+        with open(filename, 'wb') as f:
+            _write_text(f, array, header, fmt, delimiter)
+    elif file_format == 'gzip':
+        with ParallelGzipWriter(filename, level=1) as f:
+            _write_text(f, array, header, fmt, delimiter)
+    elif file_format == 'npy':
+        numpy.save(filename, array)
+    elif file_format == 'npz':
+        array = numpy.asarray(array)
+        if names is None:
+            numpy.savez_compressed(filename, data=array, header=header)
+        else:
+            numpy.savez_compressed(filename, header=header, **dict(zip(names, array.T)))
+    elif file_format == 'hdf5':
+        import h5py
+        array = numpy.asarray(array)
+        with h5py.File(filename, 'w') as f:
+            f.attrs['header'] = header
+            columns = [('data', array)] if names is None else zip(names, array.T)
+            for name, column in columns:
+                f.create_dataset(name, data=column, chunks=True, compression='gzip', shuffle=True)
+    return filename
@@ -0,0 +1,98 @@
+import struct
+import zlib
+import numpy
+
+
+__all__ = [
+    "colormap",
+    "raster_plane",
+    "write_png",
+]
+
+
+# Palette entries of a raster image: the colormap, then the contour lines and
+# the atom markers
+_COLORS = 254
+_CONTOUR = 254
+_ATOM = 255
+
+# Radius in pixels of the atom markers
+_MARKER = 3
+
+
+# PNG chunk: length, type, data and CRC of the type and data
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+# Write a PNG image of 8 bit pixels: a 2d array of indices into palette, an
+# (n, 3) array of RGB colors, or without palette a (height, width, 3) array of
+# RGB colors. The image is encoded with zlib alone, without figure machinery.
+def write_png(filename, pixels, palette=None, level=6):
+    pixels = numpy.ascontiguousarray(pixels, dtype=numpy.uint8)
+    height, width = pixels.shape[:2]
+    kind = 3 if palette is not None else 2
+    # Every row starts with the filter type, 0 = none
+    rows = numpy.zeros((height, 1 + pixels[0].size), dtype=numpy.uint8)
+    rows[:, 1:] = pixels.reshape(height, -1)
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, kind, 0, 0, 0)))
+        if palette is not None:
+            f.write(_png_chunk(b'PLTE', numpy.asarray(palette, dtype=numpy.uint8).tobytes()))
+        f.write(_png_chunk(b'IDAT', zlib.compress(rows.tobytes(), level)))
+        f.write(_png_chunk(b'IEND', b''))
+
+
+# RGB colors of a matplotlib colormap sampled at n levels. Only the colormaps
+# are imported, not pyplot.
+def colormap(name='viridis', n=_COLORS):
+    try:
+        from matplotlib import colormaps
+        cmap = colormaps[name]
+    except ImportError:
+        # matplotlib < 3.5
+        from matplotlib import cm
+        cmap = cm.get_cmap(name)
+    return numpy.round(cmap(numpy.linspace(0., 1., n))[:, :3] * 255).astype(numpy.uint8)
+
+
+# Map a plane of values z, indexed [x, y] on the axes x and y as returned by
+# interpolate_plane, to a palette image with x to the right and y up. Values
+# are scaled linearly between vmin and vmax (default: their range). With
+# contours, the boundaries between contours + 1 equal bins of values are drawn
+# as lines; atoms is a list of (x, y) positions marked with dots.
+def raster_plane(z, x, y, cmap='viridis', contours=0, atoms=(), vmin=None, vmax=None):
+    z = numpy.asarray(z)
+    vmin = z.min() if vmin is None else vmin
+    vmax = z.max() if vmax is None else vmax
+    scaled = (z - vmin) * (1. / (vmax - vmin) if vmax > vmin else 0.)
+    numpy.clip(scaled, 0., 1., out=scaled)
+    pixels = (scaled * (_COLORS - 1) + 0.5).astype(numpy.uint8)
+
+    if contours > 0:
+        # A pixel is on a line when its bin differs from that of the next pixel
+        bins = numpy.minimum((scaled * (contours + 1)).astype(numpy.uint8), contours)
+        line = numpy.zeros(bins.shape, dtype=bool)
+        line[1:, :] |= bins[1:, :] != bins[:-1, :]
+        line[:, 1:] |= bins[:, 1:] != bins[:, :-1]
+        pixels[line] = _CONTOUR
+
+    if len(atoms):
+        x = numpy.asarray(x)[:, 0]
+        y = numpy.asarray(y)[0, :]
+        nx, ny = pixels.shape
+        di, dj = numpy.mgrid[-_MARKER:_MARKER + 1, -_MARKER:_MARKER + 1]
+        disk = di ** 2 + dj ** 2 <= _MARKER ** 2
+        di, dj = di[disk], dj[disk]
+        for ax, ay in atoms:
+            i = int(round((ax - x[0]) / (x[-1] - x[0]) * (nx - 1))) + di
+            j = int(round((ay - y[0]) / (y[-1] - y[0]) * (ny - 1))) + dj
+            inside = (i >= 0) & (i < nx) & (j >= 0) & (j < ny)
+            pixels[i[inside], j[inside]] = _ATOM
+
+    palette = numpy.zeros((256, 3), dtype=numpy.uint8)
+    palette[:_COLORS] = colormap(cmap, _COLORS)
+    palette[_ATOM] = 255
+    # Rows of the image run from the top, i.e. the largest y
+    return pixels.T[::-1], palette
@@ -0,0 +1,191 @@
+from __future__ import print_function
+
+import os
+import re
+import signal
+import time
+from subprocess import Popen, CalledProcessError
+
+
+__all__ = [
+    "VASP_ERRORS",
+    "VASP_PROGRESS",
+    "Progress",
+    "run_monitored",
+]
+
+
+# Progress of VASP: (file, pattern, name) of the lines counted, or of the value
+# of the group of the pattern for patterns with one
+VASP_PROGRESS = (
+    ('OSZICAR', r'^\s*(?:DAV|RMM|CG|DIA|EIG)\s*:', 'iterations'),
+    ('OSZICAR', r'\bF=', 'ionic steps'),
+    ('OUTCAR', r'NKPTS\s*=\s*(\d+)', 'k-points'),
+)
+
+# Lines of VASP output after which it will not get anywhere: (file, pattern)
+VASP_ERRORS = (
+    ('vasp.out', r'VERY BAD NEWS|ZBRENT: fatal|EDDDAV: Call to ZHEGV failed|Error EDDDAV|internal error'),
+)
+
+# Seconds the processes of a run get to exit once terminated, before they are
+# killed
+_GRACE = 10.
+
+
+# New complete lines of a file that is being written, read from where the
+# previous call stopped. A file that does not exist yet has no lines, and one
+# that shrinks, i.e. was written anew, is read again from the start.
+class _Tail(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self._offset = 0
+        self._partial = b''
+
+    def lines(self):
+        try:
+            size = os.path.getsize(self.filename)
+            if size < self._offset:
+                self._offset, self._partial = 0, b''
+            if size == self._offset:
+                return []
+            with open(self.filename, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+        except (OSError, IOError):
+            return []
+        self._offset += len(data)
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        return [line.decode('latin1') for line in lines]
+
+
+# Progress of a program followed through the files it writes in directory:
+# patterns are (file, pattern, name) as VASP_PROGRESS, and errors are (file,
+# pattern) of lines after which the program will not succeed. update() reads
+# what was written since the last call; counts holds the number of lines
+# matched for every name, values the last value matched, and error the first
+# error line found.
+class Progress(object):
+    def __init__(self, patterns=VASP_PROGRESS, errors=VASP_ERRORS, directory=None):
+        directory = directory or os.curdir
+        self._tails = dict()
+        for filename in set(f for f, _, _ in patterns) | set(f for f, _ in errors):
+            self._tails[filename] = _Tail(os.path.join(directory, filename))
+        self._patterns = [(f, re.compile(p), name) for f, p, name in patterns]
+        self._errors = [(f, re.compile(p)) for f, p in errors]
+        self.counts = dict((name, 0) for _, p, name in self._patterns if not p.groups)
+        self.values = dict()
+        self.error = None
+        self.start = self.changed = time.time()
+
+    # Read the new lines of the files, and return whether there was progress
+    def update(self):
+        changed = False
+        for filename, tail in self._tails.items():
+            for line in tail.lines():
+                for f, pattern, name in self._patterns:
+                    match = f == filename and pattern.search(line)
+                    if not match:
+                        continue
+                    if pattern.groups:
+                        changed |= self.values.get(name) != match.group(1)
+                        self.values[name] = match.group(1)
+                    else:
+                        self.counts[name] += 1
+                        changed = True
+                for f, pattern in self._errors:
+                    if f == filename and self.error is None and pattern.search(line):
+                        self.error = line.strip()
+        if changed:
+            self.changed = time.time()
+        return changed
+
+    # Values, counts, time and rate of the first count, e.g. 'k-points 120,
+    # iterations 14, ionic steps 0 after 420 s (2.0 iterations/min)'
+    def __str__(self):
+        elapsed = time.time() - self.start
+        names = [name for _, _, name in self._patterns]
+        report = ', '.join('%s %s' % (name, self.values[name]) for name in names if name in self.values)
+        counted = [name for name in names if name in self.counts]
+        if counted:
+            report += (', ' if report else '') + ', '.join('%s %d' % (name, self.counts[name]) for name in counted)
+        report += ' after %d s' % elapsed
+        if counted and elapsed > 0:
+            report += ' (%.1f %s/min)' % (60. * self.counts[counted[0]] / elapsed, counted[0])
+        return report
+
+
+# Stop a process and its children: its process group is sent SIGTERM, then
+# SIGKILL if it is still running after the grace period
+def _terminate(process, grace=_GRACE):
+    for sig in (signal.SIGTERM, getattr(signal, 'SIGKILL', signal.SIGTERM)):
+        if process.poll() is not None:
+            return
+        try:
+            os.killpg(process.pid, sig)
+        except (OSError, AttributeError):
+            if sig == signal.SIGTERM:
+                process.terminate()
+            else:
+                process.kill()
+        deadline = time.time() + grace
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+    process.wait()
+
+
+# Run command (a list of arguments) in directory cwd, following its progress
+# (a Progress of that directory, by default that of VASP) every interval
+# seconds and printing it every report seconds as long as it changes. The run
+# is stopped, its processes are terminated and CalledProcessError is raised:
+# when the command fails, when an error line of progress is written, after
+# timeout seconds, after stall seconds without progress, or once the event stop
+# is set, e.g. by a concurrent run that failed. An error line found once the
+# command has exited fails the run as well, whatever its exit status. stdout is the file the output
+# of the command goes to (default: that of this process), and name prefixes
+# the reports.
+def run_monitored(command, cwd=None, stdout=None, progress=None, timeout=None, stall=None, interval=5., report=60.,
+                  stop=None, name=None):
+    progress = progress or Progress(directory=cwd)
+    prefix = '%s: ' % name if name else ''
+    # Start a process group, so that MPI launchers are stopped with their ranks
+    process = Popen(command, cwd=cwd, stdout=stdout, stderr=stdout, preexec_fn=getattr(os, 'setsid', None))
+    reported = time.time()
+    reason = None
+    try:
+        while process.poll() is None:
+            if stop is not None:
+                stop.wait(interval)
+            else:
+                time.sleep(interval)
+            progress.update()
+            now = time.time()
+            if progress.changed > reported and now - reported >= report:
+                print('%s%s' % (prefix, progress))
+                reported = now
+            if progress.error is not None:
+                reason = 'error: %s' % progress.error
+            elif timeout and now - progress.start > timeout:
+                reason = 'no result after %d s' % timeout
+            elif stall and now - progress.changed > stall:
+                reason = 'no progress for %d s' % stall
+            elif stop is not None and stop.is_set():
+                reason = 'stopped'
+            if reason is not None:
+                break
+    except BaseException:
+        _terminate(process)
+        raise
+    if reason is not None:
+        print('%sStopping %s, %s' % (prefix, command[0], reason))
+        _terminate(process)
+    progress.update()
+    print('%s%s finished: %s' % (prefix, command[0], progress))
+    if reason is None and progress.error is not None:
+        # Written just before the command exited, which may be with status 0, e.g. after a Fortran STOP
+        reason = 'error: %s' % progress.error
+        print('%s%s failed, %s' % (prefix, command[0], reason))
+    if reason is not None or process.returncode != 0:
+        raise CalledProcessError(process.returncode, command)
+    return process.returncode
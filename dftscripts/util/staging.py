@@ -0,0 +1,50 @@
+import os
+import shutil
+
+
+__all__ = [
+    "SCRATCH_DIR",
+    "stage_file",
+]
+
+
+# Where temporary run directories are made. Hard links need the run directory on
+# the same filesystem as the inputs, so by default it is made next to them.
+SCRATCH_DIR = os.environ.get('DFTSCRIPTS_SCRATCH', os.curdir)
+
+# ioctl request cloning a file on filesystems that support it (Linux FICLONE)
+_FICLONE = 0x40049409
+
+
+# Copy source to target sharing its data blocks (btrfs, XFS), where supported
+def _reflink(source, target):
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    shutil.copystat(source, target)
+
+
+# Make source available as target without copying its data when possible, and
+# return how: 'hardlink', 'symlink', 'reflink' or 'copy'. Links share the file
+# itself, so they are only for inputs the program does not write to; with
+# link=False the data is always duplicated, by reflink if the filesystem allows.
+def stage_file(source, target, link=True):
+    if link:
+        try:
+            os.link(source, target)
+            return 'hardlink'
+        except (OSError, AttributeError):
+            pass
+        try:
+            os.symlink(os.path.abspath(source), target)
+            return 'symlink'
+        except (OSError, AttributeError):
+            pass
+    try:
+        _reflink(source, target)
+        return 'reflink'
+    except (OSError, IOError, ImportError):
+        if os.path.exists(target):
+            os.remove(target)
+    shutil.copy2(source, target)
+    return 'copy'
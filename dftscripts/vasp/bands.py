@@ -1,16 +1,40 @@
 #!/usr/bin/env python
 from __future__ import print_function
 
-from pymatgen.io.vaspio.vasp_output import Vasprun
+from pymatgen.core.structure import Structure
 from pymatgen.io.vaspio.vasp_input import Incar, Kpoints
 from pymatgen.symmetry.bandstructure import HighSymmKpath
 from shutil import copy2 as cp, rmtree
-from subprocess import check_call, CalledProcessError
+from subprocess import CalledProcessError
 from tempfile import mkdtemp
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import os
+import json
+import threading
 import numpy
-import gzip
 import argparse
+import shlex
+
+from .vasprun import read_vasprun
+from ..util.bandinterp import StarInterpolator, point_group
+from ..util.cache import input_fingerprint, open_cache
+from ..util.compress import gzip_background
+from ..util.output import FORMATS, write_array
+from ..util.runner import run_monitored
+from ..util.staging import SCRATCH_DIR, stage_file
+
+# Record of the inputs of the run whose vasprun.xml backups are kept
+_ARCHIVE = 'bands_inputs.json'
+
+# Output file of the bands interpolated from the SCF run
+_INTERPOLATED = 'bands_interpolated.csv'
+
+# Prefix of the temporary directories of the runs
+TEMP_PREFIX = 'bands-'
+
+# Number of lines of the output of a failed VASP run that are printed
+_LOG_LINES = 20
 
 
 def _check(filename):
@@ -43,11 +67,227 @@ def _automatic_kpoints(density, ibz):
                    num_kpts=int(density))
 
 
-def _clean_exit(original_path, temp_path, err=1):
-    """ Cleanly quit in case of error """
-    os.chdir(original_path)
-    rmtree(temp_path)
-    exit(err)
+def _split_kpoints(kpoints, parts):
+    """
+    Split a KPOINTS file into at most parts consecutive ones: by line segments in line mode, and by
+    k-points for explicit lists. Automatic meshes cannot be split and are returned whole.
+    """
+    modes = Kpoints.supported_modes
+    if kpoints.style == modes.Line_mode:
+        segments = numpy.array_split(numpy.arange(len(kpoints.kpts) // 2), min(parts, len(kpoints.kpts) // 2))
+        return [Kpoints(kpoints.comment, style=modes.Line_mode, coord_type=kpoints.coord_type,
+                        kpts=[kpoints.kpts[j] for i in segment for j in (2 * i, 2 * i + 1)],
+                        labels=[kpoints.labels[j] for i in segment for j in (2 * i, 2 * i + 1)],
+                        num_kpts=kpoints.num_kpts)
+                for segment in segments]
+    if kpoints.style in (modes.Reciprocal, modes.Cartesian) and kpoints.num_kpts > 0:
+        chunks = numpy.array_split(numpy.arange(kpoints.num_kpts), min(parts, kpoints.num_kpts))
+        labels = kpoints.labels or [None] * kpoints.num_kpts
+        return [Kpoints(kpoints.comment, num_kpts=len(chunk), style=kpoints.style,
+                        kpts=[kpoints.kpts[i] for i in chunk], kpts_weights=[kpoints.kpts_weights[i] for i in chunk],
+                        labels=[labels[i] for i in chunk])
+                for chunk in chunks]
+    return [kpoints]
+
+
+def _run_vasp(command, rundirs, cores, timeout=None, stall=None):
+    """
+    Run VASP in each directory, all at once, reporting the progress of every run. command may hold {cores}, the
+    number of cores of each run, e.g. 'mpirun -np {cores} vasp'. Runs write their output to vasp.out, where fatal
+    errors are looked for, and the end of it is printed when a run fails. Concurrent runs are all stopped once one
+    fails. Runs are stopped after timeout seconds, or stall seconds without progress.
+    """
+    command = shlex.split(command.format(cores=cores))
+    stop = threading.Event()
+
+    def run(rundir):
+        log = os.path.join(rundir, 'vasp.out')
+        name = os.path.basename(rundir) if len(rundirs) > 1 else None
+        try:
+            with open(log, 'w') as out:
+                run_monitored(command, cwd=rundir, stdout=out, timeout=timeout, stall=stall, stop=stop, name=name)
+        except CalledProcessError:
+            stop.set()
+            with open(log) as f:
+                lines = f.readlines()[-_LOG_LINES:]
+            print('Last lines of %s:\n%s' % (log, ''.join(lines)), end='')
+            raise
+
+    if len(rundirs) == 1:
+        run(rundirs[0])
+        return
+
+    pool = ThreadPool(len(rundirs))
+    try:
+        pool.map(run, rundirs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _merge_bands(parts):
+    """ Join the arrays read from the vasprun.xml of consecutive parts of a k-path """
+    merged = dict(parts[0])
+    for key in ('kpoints', 'weights'):
+        merged[key] = numpy.concatenate([part[key] for part in parts])
+    for key in ('eigenvalues', 'occupations'):
+        merged[key] = numpy.concatenate([part[key] for part in parts], axis=1)
+    return merged
+
+
+def _read_vasprun(filename, cache=None):
+    """ Arrays read from a vasprun.xml, from the parse cache if the file was read before """
+    arrays = cache.load(filename, 'vasprun') if cache else None
+    if arrays is None:
+        arrays = read_vasprun(filename)
+        if cache:
+            cache.store(filename, 'vasprun', arrays)
+    return arrays
+
+
+def _read_bands(vaspruns, scf_vasprun='vasprun.xml', cache=None):
+    """ Bands of the runs of consecutive parts of a k-path """
+    bands = _merge_bands([read_vasprun(vasprun) for vasprun in vaspruns])
+    if len(vaspruns) > 1:
+        # Each run only sees part of the path; take the Fermi level of the SCF run
+        bands['efermi'] = _read_vasprun(scf_vasprun, cache)['efermi']
+    return bands
+
+
+def _read_archive():
+    """ Record of the archived run: fingerprint of its inputs, backups of its vasprun.xml and segment labels """
+    try:
+        with open(_ARCHIVE) as f:
+            return json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+
+
+def _archived_run(fingerprint):
+    """ Backups of the vasprun.xml of the archived run if it was made from the inputs with this fingerprint """
+    archive = _read_archive()
+    if archive is None or archive.get('fingerprint') != fingerprint or \
+            not all(os.path.isfile(name) for name in archive['backups']):
+        return None
+    return archive['backups']
+
+
+def _path_kpoints(kpoints):
+    """ k-points of a KPOINTS file in direct reciprocal coordinates, those of every segment in line mode """
+    modes = Kpoints.supported_modes
+    if not (kpoints.coord_type or 'Reciprocal').lower().startswith('r'):
+        raise Exception('Interpolation needs k-points in reciprocal coordinates')
+    if kpoints.style == modes.Line_mode:
+        ends = numpy.array(kpoints.kpts, dtype=float)
+        return numpy.concatenate([numpy.linspace(ends[i], ends[i + 1], kpoints.num_kpts)
+                                  for i in range(0, len(ends), 2)])
+    if kpoints.style == modes.Reciprocal:
+        return numpy.array(kpoints.kpts, dtype=float)
+    raise Exception('Interpolation needs a line mode or explicit KPOINTS file')
+
+
+def _interpolate_bands(scf, kpoints, ratio=5):
+    """
+    Bands at kpoints interpolated from the eigenvalues of an SCF run with star functions of the symmetry of
+    its final structure. Returns the arrays of the bands, as read from a vasprun.xml, and the interpolation.
+    """
+    rotations = point_group(scf['lattice'], scf['frac_coords'], scf['species'])
+    interpolation = StarInterpolator(scf['lattice'], scf['kpoints'], scf['eigenvalues'], rotations, ratio)
+    print('Interpolating the bands of %d k-points with %d star functions of %d rotations'
+          % (len(interpolation.kpoints), interpolation.nstars, len(rotations)))
+    bands = dict(kpoints=kpoints, rec_lattice=scf['rec_lattice'], efermi=scf['efermi'],
+                 eigenvalues=interpolation(kpoints))
+    return bands, interpolation
+
+
+def _interpolation_error(interpolation, nscf, window=1.):
+    """ Print the error of the interpolated bands at the k-points of a non-SCF run """
+    interpolated = interpolation(nscf['kpoints'])
+    nbands = min(interpolated.shape[2], nscf['eigenvalues'].shape[2])
+    exact = nscf['eigenvalues'][..., :nbands]
+    error = abs(interpolated[..., :nbands] - exact)
+    print('Error of the interpolation at the %d k-points of the non-SCF run:' % exact.shape[1])
+    print('  all bands: rms %f eV, max %f eV' % (numpy.sqrt((error ** 2).mean()), error.max()))
+    near = abs(exact - nscf['efermi']) < window
+    if near.any():
+        print('  within %g eV of Efermi: rms %f eV, max %f eV'
+              % (window, numpy.sqrt((error[near] ** 2).mean()), error[near].max()))
+
+
+def _final_structure(filename, cache=None):
+    """ Final structure of a vasprun.xml """
+    arrays = _read_vasprun(filename, cache)
+    return Structure(arrays['lattice'], [str(s) for s in arrays['species']], arrays['frac_coords'])
+
+
+def _band_path(kpts, divisions=None):
+    """
+    Path through the Cartesian k-points kpts of a band structure. Returns a mask of the k-points to keep,
+    without the first k-point of a segment that repeats the last one of the previous segment, and the
+    segment and distance along the path of the k-points kept. Segments are every divisions k-points in line
+    mode, and otherwise end at repeated k-points. The distance does not grow between segments, so that
+    segments that do not meet, e.g. X|U, are joined.
+    """
+    step = numpy.sqrt((numpy.diff(kpts, axis=0) ** 2).sum(axis=1))
+    keep = numpy.concatenate([[True], step > 1.e-12])
+    if divisions:
+        segment = numpy.arange(len(kpts)) // divisions
+    else:
+        segment = numpy.cumsum(~keep)
+    step[segment[1:] != segment[:-1]] = 0.
+    distance = numpy.concatenate([[0.], numpy.cumsum(step)])
+    return keep, segment[keep], distance[keep]
+
+
+def _write_bands(arrays, file_format='text', labels=None, outfile='bands.csv'):
+    """
+    Write the bands of every spin of a vasprun.xml to outfile, with energies relative to Efermi. Rows are
+    the k-points along the path: segment, distance along the path, Cartesian k-point, then the bands of each
+    spin. labels are the high-symmetry points at the start and end of every segment, as in line mode KPOINTS.
+    """
+    # Cartesian k-points, with the factor 2 pi of pymatgen's reciprocal lattice
+    kpts = 2 * numpy.pi * numpy.dot(arrays['kpoints'], arrays['rec_lattice'])
+    keep, segment, distance = _band_path(kpts, int(arrays.get('divisions', 0)))
+
+    print('Preparing %s' % outfile)
+    print('Shifting energies so Efermi = 0.')
+    eigenvalues = numpy.asarray(arrays['eigenvalues'])
+    nspins, nbands = eigenvalues.shape[0], eigenvalues.shape[2]
+    bands = eigenvalues.transpose(1, 0, 2)[keep].reshape(len(segment), -1) - arrays['efermi']
+    out = numpy.hstack([segment[:, None] + 1, distance[:, None], kpts[keep], bands])
+
+    # There may be multiple bands due to spin.
+    if nspins == 1:
+        names = ['band%d' % (i + 1) for i in range(nbands)]
+        header = ' segment, distance, kptx, kpty, kptz, band1, band2, ... '
+    else:
+        names = ['band%d_%s' % (i + 1, spin) for spin in ('up', 'down') for i in range(nbands)]
+        header = ' segment, distance, kptx, kpty, kptz, band1_up, band2_up, ..., band1_down, band2_down, ... '
+    if labels:
+        header += '\n segments: ' + ', '.join('%d = %s-%s' % (i + 1, labels[2 * i], labels[2 * i + 1])
+                                              for i in range(len(labels) // 2))
+
+    # Write bands to csv file.
+    filename = write_array(outfile, out, header, file_format,
+                           names=['segment', 'distance', 'kptx', 'kpty', 'kptz'] + names)
+    print('Written %s to disk' % filename)
+
+
+def write_bands(vasprun=None, file_format='text', cache=True):
+    """
+    Write the bands of a finished band structure run. By default these are the backups made by main(), listed
+    with the labels of the segments in bands_inputs.json, or bands_vasprun.xml.gz for runs archived without it.
+    vasprun may instead name a vasprun.xml, or a list of those of consecutive parts of a k-path.
+    """
+    archive = _read_archive() if vasprun is None else None
+    if archive is not None:
+        vaspruns, labels = archive['backups'], archive.get('labels')
+    else:
+        vaspruns = vasprun or 'bands_vasprun.xml.gz'
+        vaspruns, labels = [vaspruns] if isinstance(vaspruns, str) else list(vaspruns), None
+    bands = _read_bands(vaspruns, cache=open_cache(cache))
+    print('Efermi = %f' % bands['efermi'])
+    _write_bands(bands, file_format, labels)
 
 
 def main():
@@ -61,6 +301,38 @@ def main():
                         help='linemode file')
     parser.add_argument('-v', '--vasp', nargs='?', default='vasp', type=str,
                         help='vasp executable')
+    parser.add_argument('-nc', '--no-cache', action='store_true',
+                        help='Do not use the parse cache (default: cache enabled)')
+    parser.add_argument('-ff', '--file-format', choices=FORMATS, default='text',
+                        help='File format of the bands: text, gzip = compressed text, npy, npz = compressed '
+                             'numpy, hdf5 = chunked and compressed HDF5, needs h5py (default: text)')
+    parser.add_argument('-sr', '--scratch', nargs='?', default=SCRATCH_DIR, type=str,
+                        help='Directory in which the temporary run directory is made; on the filesystem of the '
+                             'inputs they are hard linked instead of copied (default: $DFTSCRIPTS_SCRATCH or the '
+                             'current directory)')
+    parser.add_argument('-cp', '--copy', action='store_true',
+                        help='Copy POSCAR, POTCAR and CHGCAR instead of linking them (default: disabled)')
+    parser.add_argument('-np', '--parallel', nargs='?', default=1, type=int,
+                        help='Number of concurrent VASP runs the k-path is split into, by line segments in line '
+                             'mode and by k-points for explicit lists (default: 1)')
+    parser.add_argument('-cpr', '--cores-per-run', nargs='?', default=None, type=int,
+                        help='Cores of each run, substituted for {cores} in the vasp command, e.g. '
+                             '-v "mpirun -np {cores} vasp" (default: the cores of the machine divided among the '
+                             'runs)')
+    parser.add_argument('-tl', '--time-limit', nargs='?', default=None, type=float,
+                        help='Seconds after which VASP is stopped (default: no limit)')
+    parser.add_argument('-st', '--stall', nargs='?', default=None, type=float,
+                        help='Seconds without a new iteration after which VASP is stopped (default: no limit)')
+    parser.add_argument('-i', '--interpolate', action='store_true',
+                        help='Interpolate the bands from the eigenvalues of the SCF run in vasprun.xml instead of '
+                             'running VASP, with star functions of the crystal symmetry, and write them to %s '
+                             '(default: disabled)' % _INTERPOLATED)
+    parser.add_argument('-r', '--ratio', nargs='?', default=5, type=int,
+                        help='Number of star functions per irreducible k-point of the SCF run when interpolating '
+                             '(default: 5)')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Run VASP even if the inputs are those of the run recorded in %s, whose vasprun.xml '
+                             'backups are kept (default: disabled)' % _ARCHIVE)
     args = parser.parse_args()
     
     line_density = args.density
@@ -74,103 +346,146 @@ def main():
     _check('CHGCAR')
 
     # Get IBZ from vasprun
-    vasprun = Vasprun('vasprun.xml')
-    ibz = HighSymmKpath(vasprun.final_structure)
-
-    # Create a temp directory
-    print('Create temporary directory ... ', end='')
-    tempdir = mkdtemp()
-    print(tempdir)
+    ibz = HighSymmKpath(_final_structure('vasprun.xml', open_cache(not args.no_cache)))
 
     # Edit the inputs
-    print('Saving new inputs in temporary directory ... ')
     incar = Incar.from_file('INCAR')
     print('Making the following changes to the INCAR:')
     print('  ICHARG = 11')
     print('  ISMEAR = 0')
     print('  SIGMA = %f' % args.sigma)
+    print('  LCHARG = .FALSE.')
     incar['ICHARG'] = 11  # Constant density
     incar['ISMEAR'] = 0  # Gaussian Smearing
     incar['SIGMA'] = args.sigma  # Smearing temperature
-    incar.write_file(os.path.join(tempdir, 'INCAR'))
+    incar['LCHARG'] = False  # The staged CHGCAR may be a link to the original, which must not be overwritten
     # Generate line-mode kpoint file
 
     if line_file is None:
         print('Creating a new KPOINTS file:')
         kpoints = _automatic_kpoints(line_density, ibz)
-        kpoints.write_file(os.path.join(tempdir, 'KPOINTS'))
         print('### BEGIN KPOINTS')
         print(kpoints)
         print('### END KPOINTS')
     else:
-        cp(line_file, os.path.join(tempdir, 'KPOINTS'))
-    
-    # Copy other files (May take some time...)
-    print('Copying POSCAR, POTCAR and CHGCAR to the temporary directory.')
-    cp('POSCAR', os.path.join(tempdir, 'POSCAR'))
-    cp('POTCAR', os.path.join(tempdir, 'POTCAR'))
-    cp('CHGCAR', os.path.join(tempdir, 'CHGCAR'))
+        kpoints = Kpoints.from_file(line_file)
+    # High-symmetry points at the ends of the segments of the path, labelling them in the bands
+    labels = kpoints.labels if kpoints.style == Kpoints.supported_modes.Line_mode else None
+
+    # Reuse the backups of a previous run of the same inputs instead of running VASP again
+    if line_file is None:
+        kpoints_file = str(kpoints)
+    else:
+        with open(line_file) as f:
+            kpoints_file = f.read()
+    fingerprint = input_fingerprint(('POSCAR', 'POTCAR', 'CHGCAR'), (incar.get_string(sort_keys=True), kpoints_file))
 
-    # cd to temp directory and run vasp
+    if args.interpolate:
+        scf = _read_vasprun('vasprun.xml', open_cache(not args.no_cache))
+        bands, interpolation = _interpolate_bands(scf, _path_kpoints(kpoints), args.ratio)
+        if labels:
+            bands['divisions'] = kpoints.num_kpts
+        print('Efermi = %f' % bands['efermi'])
+        # Kept apart from the bands of a non-SCF run, which the interpolation must not overwrite
+        _write_bands(bands, args.file_format, labels, _INTERPOLATED)
+
+        # Estimate the error with the non-SCF run of the same inputs
+        backups = _archived_run(fingerprint)
+        if backups:
+            _interpolation_error(interpolation, _read_bands(backups, cache=open_cache(not args.no_cache)))
+        else:
+            print('No archived non-SCF run of these inputs: run bands without --interpolate to estimate the error '
+                  'of the interpolation')
+        return
+
+    backups = None if args.force else _archived_run(fingerprint)
+    if backups:
+        print('The inputs are those of the run archived in %s, not running VASP (use --force to run it)'
+              % ', '.join(backups))
+        bands = _read_bands(backups, cache=open_cache(not args.no_cache))
+        print('Efermi = %f' % bands['efermi'])
+        _write_bands(bands, args.file_format, labels)
+        return
+
+    # Create a temp directory
+    print('Create temporary directory ... ', end='')
+    tempdir = mkdtemp(prefix=TEMP_PREFIX, dir=os.path.abspath(args.scratch))
+    print(tempdir)
+
+    # The temporary directory, which holds links to the inputs, is deleted whatever happens
     path = os.getcwd()
-    os.chdir(tempdir)
-    print('Running VASP in the temporary directory ...')
-    try:
-        check_call(args.vasp)
-    except CalledProcessError:
-        print('There was an error running VASP')
-        _clean_exit(path, tempdir)
-
-    # Read output
-    vasprun = Vasprun('vasprun.xml')
-    ibz = HighSymmKpath(vasprun.final_structure)
-    _, _ = ibz.get_kpoints(line_density)
-    bands = vasprun.get_band_structure()
-    print('Success! Efermi = %f' % bands.efermi)
-    
-    # Backup vasprun.xml only
-    print('Making a gzip backup of vasprun.xml called bands_vasprun.xml.gz')
-    zfile = os.path.join(path, 'bands_vasprun.xml.gz')
+    compressions = []
     try:
-        with gzip.open(zfile, 'wb') as gz, open('vasprun.xml', 'rb') as vr:
-            gz.writelines(vr)
-    except (OSError, IOError):
-        print('There was an error with gzip')
-        _clean_exit(path, tempdir)
+        # Split the path among concurrent runs, each in its own directory; a single run copies the linemode file
+        if args.parallel > 1:
+            segments = _split_kpoints(kpoints, args.parallel)
+        else:
+            segments = [None if line_file else kpoints]
+        if len(segments) > 1:
+            print('Splitting the k-points among %d runs' % len(segments))
+            rundirs = [os.path.join(tempdir, 'segment%d' % i) for i in range(len(segments))]
+        else:
+            rundirs = [tempdir]
+        cores = args.cores_per_run or max(cpu_count() // len(segments), 1)
 
-    # Return to original path
-    os.chdir(path)
+        # Link other files, which VASP only reads (copies may take some time...)
+        print('Saving new inputs in temporary directory ... ')
+        print('Staging POSCAR, POTCAR and CHGCAR in the temporary directory:')
+        for rundir, segment in zip(rundirs, segments):
+            if rundir != tempdir:
+                os.mkdir(rundir)
+            incar.write_file(os.path.join(rundir, 'INCAR'))
+            if segment is None:
+                cp(line_file, os.path.join(rundir, 'KPOINTS'))
+            else:
+                segment.write_file(os.path.join(rundir, 'KPOINTS'))
+            for name in ('POSCAR', 'POTCAR', 'CHGCAR'):
+                print('  %s: %s' % (name, stage_file(name, os.path.join(rundir, name), link=not args.copy)))
 
-    # Write band structure
-    
-    # There may be multiple bands due to spin or noncollinear.
-    for key, item in bands.bands.items():
-        print('Preparing bands_%s.csv' % key)
-        
-        kpts = []
-
-        # Get list of kpoints
-        for kpt in bands.kpoints:
-            kpts.append(kpt.cart_coords)
-        
-        # Subtract fermi energy
-        print('Shifting energies so Efermi = 0.')
-        band = numpy.array(item) - bands.efermi
-
-        # Prepend kpoint vector as label
-        out = numpy.hstack([kpts, band.T])
-        
-        final = []
-        lastrow = float('inf') * numpy.ones(3)
-        for row in out:
-            if numpy.linalg.norm(row[:3] - lastrow) > 1.e-12:
-                final.append(row)
-            lastrow = row[:3]
-
-        # Write bands to csv file.
-        print('Writing bands_%s.csv to disk' % key)
-        with open('bands_%s.csv' % key, 'w+') as f:
-            numpy.savetxt(f, numpy.array(final), delimiter=',', header=' kptx, kpty, kptz, band1, band2, ... ')
-
-    # Delete temporary directory
-    _clean_exit(path, tempdir, 0)
+        # cd to temp directory and run vasp
+        os.chdir(tempdir)
+        print('Running VASP in the temporary directory ...')
+        try:
+            _run_vasp(args.vasp, rundirs, cores, args.time_limit, args.stall)
+        except CalledProcessError:
+            print('There was an error running VASP')
+            exit(1)
+
+        # Backup vasprun.xml only, in the background while the output is processed
+        backups = ['bands_vasprun.xml.gz'] if len(rundirs) == 1 else \
+            ['bands_vasprun_%d.xml.gz' % i for i in range(len(rundirs))]
+        if os.path.isfile(os.path.join(path, _ARCHIVE)):
+            os.remove(os.path.join(path, _ARCHIVE))
+        print('Making a gzip backup of vasprun.xml called %s' % ', '.join(backups))
+        compressions = [gzip_background(os.path.join(rundir, 'vasprun.xml'), os.path.join(path, backup))
+                        for rundir, backup in zip(rundirs, backups)]
+
+        # Read output
+        bands = _read_bands([os.path.join(rundir, 'vasprun.xml') for rundir in rundirs],
+                            os.path.join(path, 'vasprun.xml'), open_cache(not args.no_cache))
+        print('Success! Efermi = %f' % bands['efermi'])
+
+        # Return to original path
+        os.chdir(path)
+
+        # Write band structure
+        _write_bands(bands, args.file_format, labels)
+
+        # The temporary directory holds the files being compressed
+        try:
+            for compression in compressions:
+                compression.wait()
+        except (OSError, IOError):
+            print('There was an error with gzip')
+            exit(1)
+
+        # Archive the fingerprint of the inputs with the backups
+        with open(_ARCHIVE, 'w') as f:
+            json.dump(dict(fingerprint=fingerprint, backups=backups, labels=list(labels) if labels else None), f,
+                      indent=1)
+    finally:
+        # Delete temporary directory, once the files in it are compressed
+        os.chdir(path)
+        for compression in compressions:
+            compression.join()
+        rmtree(tempdir)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shlex
+import sys
+import time
+import traceback
+from multiprocessing import Pool, cpu_count
+
+from . import bands, density, dos
+from ..util.output import FORMATS
+
+
+def _dos(options, args):
+    dos.write_dos(cache=not options['no_cache'], file_format=options['file_format'])
+
+
+def _bands(options, args):
+    bands.write_bands(file_format=options['file_format'], cache=not options['no_cache'])
+
+
+def _density(main):
+    def run(options, args):
+        common = ['--file-format', options['file_format']] + (['--no-cache'] if options['no_cache'] else [])
+        main(common + args)
+    return run
+
+
+# Extraction tasks: the file a run directory needs for the task (the first found
+# of a tuple of files), and the function running it in that directory with the
+# batch options and the task's own arguments
+TASKS = dict(
+    dos=('vasprun.xml', _dos),
+    bands=(('bands_inputs.json', 'bands_vasprun.xml.gz'), _bands),
+    density1d=('CHGCAR', _density(density.main_line)),
+    density2d=('CHGCAR', _density(density.main)),
+    density3d=('CHGCAR', _density(density.main_volume)),
+    densityavg=('CHGCAR', _density(density.main_average)),
+    densityint=('CHGCAR', _density(density.main_integrate)),
+)
+
+
+# Batch options that change the outputs of the tasks, kept with every result
+_OUTPUT_OPTIONS = ('file_format',)
+
+
+def _output_options(options):
+    """ The batch options that the outputs of a task depend on """
+    return dict((name, options[name]) for name in _OUTPUT_OPTIONS)
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog='vaspbatch',
+                                     description='Run the extraction scripts in every run directory under a root')
+    parser.add_argument('root', type=str, nargs='?', default='.',
+                        help='Directory searched for run directories (default: .)')
+    parser.add_argument('-t', '--tasks', nargs='+', choices=sorted(TASKS), default=['dos'],
+                        help='Tasks run in every directory that has their input: dos and density* need vasprun.xml '
+                             'and CHGCAR, bands needs the bands_inputs.json or bands_vasprun.xml.gz written by '
+                             'bands (default: dos)')
+    parser.add_argument('-a', '--args', nargs=2, action='append', default=[], metavar=('TASK', 'ARGS'),
+                        help='Command line arguments of a density task, e.g. -a density2d "-s up -fmt matrix" '
+                             '(default: None)')
+    parser.add_argument('-j', '--jobs', nargs='?', type=int, default=0,
+                        help='Number of directories processed at a time, 0 uses every core (default: 0)')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Run tasks even if their outputs are up to date (default: disabled)')
+    parser.add_argument('-m', '--manifest', nargs='?', type=str, default=None,
+                        help='Manifest of the results (default: ROOT/manifest.json)')
+    parser.add_argument('-ff', '--file-format', choices=FORMATS, default='text',
+                        help='File format of the outputs (default: text)')
+    parser.add_argument('-nc', '--no-cache', action='store_true',
+                        help='Do not use the parse cache (default: cache enabled)')
+    return parser
+
+
+def _stat(filename):
+    """ Size and modification time of a file, or None if it does not exist """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+def _snapshot(directory):
+    """ Modification time of every file in a directory """
+    return dict((name, os.path.getmtime(os.path.join(directory, name))) for name in os.listdir(directory)
+                if os.path.isfile(os.path.join(directory, name)))
+
+
+def _input(task, directory):
+    """ The input file of a task in a directory, or None """
+    names = TASKS[task][0]
+    for name in names if isinstance(names, tuple) else (names,):
+        if os.path.isfile(os.path.join(directory, name)):
+            return name
+    return None
+
+
+def _up_to_date(record, directory, args, options):
+    """ Whether a manifest record of a task holds for the current input, arguments and batch options """
+    if record is None or record['status'] != 'done' or record['args'] != args:
+        return False
+    if record.get('options') != _output_options(options):
+        return False
+    name = _input(record['task'], directory)
+    if name is None or record['input'] != _stat(os.path.join(directory, name)):
+        return False
+    return all(os.path.isfile(os.path.join(directory, name)) for name in record['outputs'])
+
+
+def _discover(root, tasks):
+    """ Run directories under root with the tasks whose input they have """
+    runs = []
+    for directory, dirnames, filenames in os.walk(root):
+        # Temporary directories of bands runs hold links to the inputs of their run directory
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith(bands.TEMP_PREFIX))
+        found = [task for task in tasks if _input(task, directory)]
+        if found:
+            runs.append((directory, found))
+    return runs
+
+
+def _run_directory(job):
+    """
+    Run tasks in a directory, one after the other, each with its output in a log
+    file, and return a manifest record for each task
+    """
+    directory, tasks, options = job
+    records = []
+    path = os.getcwd()
+    os.chdir(directory)
+    stdout = sys.stdout
+    try:
+        for task, args in tasks:
+            before = _snapshot('.')
+            start = time.time()
+            log = 'batch_%s.log' % task
+            record = dict(directory=directory, task=task, args=args, options=_output_options(options),
+                          input=_stat(_input(task, '.')), log=log)
+            with open(log, 'w') as f:
+                sys.stdout = f
+                try:
+                    TASKS[task][1](options, shlex.split(args))
+                    record['status'] = 'done'
+                except (Exception, SystemExit) as e:
+                    # argparse exits on bad arguments
+                    traceback.print_exc(file=f)
+                    record['status'] = 'failed'
+                    record['error'] = repr(e)
+                finally:
+                    sys.stdout = stdout
+            after = _snapshot('.')
+            record['outputs'] = sorted(name for name, mtime in after.items()
+                                       if name != log and (name not in before or mtime > before[name]))
+            record['seconds'] = time.time() - start
+            records.append(record)
+    finally:
+        sys.stdout = stdout
+        os.chdir(path)
+    return records
+
+
+def _write_manifest(filename, records):
+    temp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(temp, 'w') as f:
+        json.dump(records, f, indent=1, sort_keys=True)
+    os.rename(temp, filename)
+
+
+def main(args=None):
+    options = vars(_build_parser().parse_args(args))
+    manifest = options['manifest'] or os.path.join(options['root'], 'manifest.json')
+    task_args = dict((task, '') for task in TASKS)
+    for task, value in options['args']:
+        if task not in TASKS:
+            raise Exception('Unknown task: %s' % task)
+        task_args[task] = value
+
+    # Results of previous batches, by directory and task
+    records = dict()
+    if os.path.isfile(manifest):
+        with open(manifest) as f:
+            records = dict(((r['directory'], r['task']), r) for r in json.load(f))
+
+    jobs = []
+    skipped = 0
+    for directory, tasks in _discover(options['root'], options['tasks']):
+        todo = [(task, task_args[task]) for task in tasks if options['force'] or
+                not _up_to_date(records.get((directory, task)), directory, task_args[task], options)]
+        skipped += len(tasks) - len(todo)
+        if todo:
+            jobs.append((directory, todo, options))
+    print('%d tasks in %d directories to run, %d up to date' % (sum(len(j[1]) for j in jobs), len(jobs), skipped))
+
+    # Directories are processed in separate processes, since the tasks change the working directory
+    pool = Pool(options['jobs'] if options['jobs'] > 0 else cpu_count())
+    try:
+        for results in pool.imap_unordered(_run_directory, jobs):
+            for record in results:
+                print('%s %s: %s (%.1f s)' % (record['directory'], record['task'], record['status'],
+                                              record['seconds']))
+                records[(record['directory'], record['task'])] = record
+            # Keep the manifest current, so an interrupted batch resumes where it stopped
+            _write_manifest(manifest, sorted(records.values(), key=lambda r: (r['directory'], r['task'])))
+    finally:
+        pool.close()
+        pool.join()
+    failed = [r for r in records.values() if r['status'] != 'done']
+    if failed:
+        print('%d tasks failed, see their logs' % len(failed))
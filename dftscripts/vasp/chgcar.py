@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import numpy
+from pymatgen.io.vaspio.vasp_input import Poscar
+
+from ..util.cache import open_cache
+
+__all__ = [
+    'SPIN_BLOCKS',
+    'read_chgcar',
+    'sum_chgcar',
+]
+
+# Grid blocks needed for each spin channel of the density
+SPIN_BLOCKS = dict(
+    total=('total',),
+    polarization=('diff',),
+    up=('total', 'diff'),
+    down=('total', 'diff'),
+)
+
+# Grid blocks in the order they appear in the file: the total density, then for
+# spin polarized runs the magnetization ('diff'). Non-collinear runs have three
+# magnetization blocks, x ('diff'), y and z.
+_BLOCKS = ('total', 'diff', 'diff_y', 'diff_z')
+
+# Number of lines parsed at a time when a block is streamed
+_LINES = 2 ** 15
+
+
+def _read_header(f):
+    """ Read the POSCAR part of the file and return it with the grid line """
+    header = [f.readline() for _ in range(6)]
+    counts = header[5].split()
+    if not all(c.isdigit() for c in counts):
+        # VASP 5 files have a line with the species names before the counts
+        header.append(f.readline())
+        counts = header[6].split()
+    # Optional selective dynamics line followed by the coordinate type
+    line = f.readline()
+    header.append(line)
+    if line.strip()[:1] in (b'S', b's'):
+        header.append(f.readline())
+    header.extend(f.readline() for _ in range(sum(int(c) for c in counts)))
+    # A blank line separates the structure from the grid
+    line = f.readline()
+    while line and not line.strip():
+        line = f.readline()
+    return b''.join(header).decode('ascii'), line
+
+
+def _find_grid_line(f, grid_line):
+    """ Advance past augmentation occupancies and moments to the next grid line """
+    line = f.readline()
+    while line and line.split() != grid_line.split():
+        line = f.readline()
+    return bool(line)
+
+
+def _block_layout(f, n):
+    """
+    Layout of a block of n values starting at the current position: its start, the
+    width of its lines, the number of lines, whether all but the last line have
+    that width, and the last line
+    """
+    start = f.tell()
+    first = f.readline()
+    per_line = len(first.split())
+    nlines = -(-n // per_line)
+    if nlines > 1:
+        f.seek(start + (nlines - 1) * len(first) - 1)
+        fixed = f.read(1) == b'\n'
+        last = f.readline()
+        fixed = fixed and len(last.split()) == n - (nlines - 1) * per_line
+    else:
+        fixed, last = True, b''
+    return start, len(first), nlines, fixed, last
+
+
+def _read_block(f, n, parse=True):
+    """
+    Read or skip a block of n values starting at the current position. Data lines
+    have a fixed width, so the block is read (or skipped) with one call instead of
+    line by line; files where this does not hold are read line by line instead.
+    """
+    start, width, nlines, fixed, last = _block_layout(f, n)
+    if not parse and fixed:
+        return None
+    if fixed:
+        f.seek(start)
+        text = f.read((nlines - 1) * width) + last
+    else:
+        f.seek(start)
+        text = b''.join(f.readline() for _ in range(nlines))
+    data = numpy.fromstring(text, sep=' ') if parse else None
+    if parse and data.size != n:
+        raise Exception('Grid block has %d values, expected %d' % (data.size, n))
+    return data
+
+
+def _add_block(f, n, out, coefficient):
+    """
+    Add coefficient times the block of n values starting at the current position to
+    out, a flat array, parsing _LINES lines at a time so that the text of the block
+    is never held in memory as a whole
+    """
+    start, width, nlines, fixed, last = _block_layout(f, n)
+    f.seek(start)
+    position = 0
+    for first in range(0, nlines, _LINES):
+        count = min(_LINES, nlines - first)
+        if fixed:
+            text = f.read((count - 1) * width) + f.readline()
+        else:
+            text = b''.join(f.readline() for _ in range(count))
+        values = numpy.fromstring(text, sep=' ')
+        if position + values.size > n:
+            raise Exception('Grid block has more than %d values' % n)
+        out[position:position + values.size] += coefficient * values
+        position += values.size
+    if position != n:
+        raise Exception('Grid block has %d values, expected %d' % (position, n))
+
+
+def read_chgcar(filename='CHGCAR', blocks=('total',), cache=True):
+    """
+    Read the structure and the requested grid blocks ('total', 'diff' and, for
+    non-collinear runs, 'diff_y' and 'diff_z') of a CHGCAR-like file.
+    Blocks that are not requested are skipped without being parsed. The grids are
+    indexed [x, y, z] and hold the raw file values (density times volume), as in
+    pymatgen's Chgcar.data.
+
+    Parsed blocks are saved in the parse cache (see dftscripts.util.cache) as
+    .npy files, and later reads of the same file memory map them instead of
+    parsing. cache may be True (default cache), False or a ParseCache.
+    """
+    cache = open_cache(cache)
+    with open(filename, 'rb') as f:
+        poscar, grid_line = _read_header(f)
+        structure = Poscar.from_string(poscar).structure
+        shape = [int(n) for n in grid_line.split()]
+
+        data = dict()
+        cached = cache.load(filename, 'chgcar', mmap_mode='r') if cache else None
+        for block in blocks:
+            if cached and block in cached and cached[block].shape == tuple(shape):
+                data[block] = cached[block]
+        missing = [block for block in blocks if block not in data]
+
+        for position, name in enumerate(_BLOCKS):
+            if not missing:
+                break
+            if position > 0 and not _find_grid_line(f, grid_line):
+                break
+            values = _read_block(f, int(numpy.prod(shape)), parse=name in missing)
+            if values is None:
+                continue
+            # Values run with x fastest; index the grid as [x, y, z] without a copy
+            grid = values.reshape(shape[::-1]).T
+            if cache:
+                cache.store(filename, 'chgcar', {name: grid})
+            data[name] = grid
+            missing.remove(name)
+
+    if missing:
+        raise Exception('%s has no %s block' % (filename, ', '.join(missing)))
+    return structure, data
+
+
+def sum_chgcar(filenames, coefficients, blocks=('total',), cache=True):
+    """
+    Linear combination of the grid blocks of several CHGCAR-like files on the same
+    grid, e.g. the charge transfer rho(AB) - rho(A) - rho(B) of an interface with
+    coefficients (1, -1, -1). Returns the structure of the first file and the
+    combined grids, indexed [x, y, z] like those of read_chgcar.
+
+    The grids and lattices of every file are checked before any block is read.
+    Blocks found in the parse cache are added from their memory maps; the others
+    are parsed a few lines at a time and added as they are read, so the memory used
+    is about one grid per requested block whatever the number of files.
+    """
+    cache = open_cache(cache)
+
+    # Check that the files can be combined
+    headers = []
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            poscar, grid_line = _read_header(f)
+        headers.append((Poscar.from_string(poscar).structure, [int(n) for n in grid_line.split()]))
+    structure, shape = headers[0]
+    for filename, (other, other_shape) in zip(filenames[1:], headers[1:]):
+        if other_shape != shape:
+            raise Exception('%s has a %s grid, %s has %s' % (filename, 'x'.join(map(str, other_shape)),
+                                                              filenames[0], 'x'.join(map(str, shape))))
+        if not numpy.allclose(other.lattice.matrix, structure.lattice.matrix):
+            raise Exception('%s and %s have different lattices' % (filename, filenames[0]))
+
+    n = int(numpy.prod(shape))
+    sums = dict((block, numpy.zeros(n)) for block in blocks)
+    for filename, coefficient in zip(filenames, coefficients):
+        cached = cache.load(filename, 'chgcar', mmap_mode='r') if cache else None
+        missing = []
+        for block in blocks:
+            if cached and block in cached and cached[block].shape == tuple(shape):
+                # The cached grid is indexed [x, y, z] in Fortran order, i.e. in file order
+                values = cached[block].ravel(order='F')
+                for start in range(0, n, _LINES * 10):
+                    sums[block][start:start + _LINES * 10] += coefficient * values[start:start + _LINES * 10]
+            else:
+                missing.append(block)
+
+        with open(filename, 'rb') as f:
+            _, grid_line = _read_header(f)
+            for position, name in enumerate(_BLOCKS):
+                if not missing:
+                    break
+                if position > 0 and not _find_grid_line(f, grid_line):
+                    break
+                if name in missing:
+                    _add_block(f, n, sums[name], coefficient)
+                    missing.remove(name)
+                else:
+                    _read_block(f, n, parse=False)
+        if missing:
+            raise Exception('%s has no %s block' % (filename, ', '.join(missing)))
+
+    # Values run with x fastest; index the grids as [x, y, z] without a copy
+    return structure, dict((block, values.reshape(shape[::-1]).T) for block, values in sums.items())
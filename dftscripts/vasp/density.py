@@ -2,26 +2,45 @@
 # plot_density.py
 
 import argparse
+import json
+import threading
 import numpy
-from pymatgen.io.vaspio.vasp_output import Chgcar
-from pymatgen.electronic_structure.core import Spin
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
-from ..util.interpolate import interpolate_plane, plane_to_cs
+from .chgcar import SPIN_BLOCKS, read_chgcar, sum_chgcar
+from ..util.average import macroscopic_average, planar_average, plane_spacing
+from ..util.integrate import SiteIndex
+from ..util.neighbors import plane_sites
+from ..util.output import FORMATS, output_filename, write_array
+from ..util.raster import raster_plane, write_png
+from ..util.interpolate import CACHE_BYTES, CHUNK, METHODS, PlaneSampler, interpolate_line, interpolate_plane, \
+    interpolate_volume, plane_to_cs
 
+# matplotlib's pyplot is not thread safe; batch slices draw their images one at a time
+_PLOT_LOCK = threading.Lock()
 
-def _build_parser():
-    # Setup parser
-    parser = argparse.ArgumentParser(prog='plot_chgcar', description='2d projection of CHGCAR')
+# Options that choose the center of a plane, of which a batch slice may set one
+_CENTER_OPTIONS = ('center_atom', 'center_cartesian', 'center_direct')
 
-    # Add options
+
+def _add_input_arguments(parser):
     parser.add_argument('filename', type=str, nargs='?', default='CHGCAR',
                         help='The CHG file (default: CHGCAR)')
     parser.add_argument('-s', '--spin-channel', choices=['total', 'polarization', 'up', 'down'], default='total',
                         help='For spin polarized calculations, the component of the density (default: total)')
+    parser.add_argument('-sp', '--single-precision', action='store_true',
+                        help='Interpolate and write the density in single precision, which halves the memory '
+                             'used; the relative error is below 1e-6 (default: disabled)')
+    parser.add_argument('-nc', '--no-cache', action='store_true',
+                        help='Do not use the parse cache (default: cache enabled)')
+    parser.add_argument('-sub', '--subtract', nargs='+', type=str, default=[],
+                        help='CHG files on the same grid whose density is subtracted from that of the CHG file, '
+                             'e.g. the parts of an interface for the charge transfer. The files are streamed and '
+                             'summed into one grid (default: None)')
 
-    # Set default commands
-    # Coordinate system options
-    group_coord = parser.add_argument_group('coordinate system')
+
+def _add_center_arguments(group_coord):
     group_coord.add_argument('-ca', '--center-atom', nargs='?', type=int,
                              help='Atom at the center (default: None)')
     group_coord.add_argument('-cc', '--center-cartesian', nargs=3, type=float,
@@ -33,6 +52,44 @@ def _build_parser():
     group_coord.add_argument('-ya', '--y-axis', nargs=3, type=float, default=[0., 0., 1.],
                              help='Direction of the y-axis (default: 0 0 1)')
 
+
+def _add_method_arguments(group_interpolate):
+    group_interpolate.add_argument('-m', '--method', choices=METHODS, default='linear',
+                                   help='Interpolation method: linear, cubic = periodic cubic spline, '
+                                        'fourier = trigonometric interpolation, best for coarse grids '
+                                        '(default: linear)')
+    group_interpolate.add_argument('-ch', '--chunk', nargs='?', type=int, default=CHUNK,
+                                   help='Number of points interpolated at a time, bounds the memory used for large '
+                                        'planes (default: %d)' % CHUNK)
+    group_interpolate.add_argument('-j', '--jobs', nargs='?', type=int, default=1,
+                                   help='Number of threads used for the interpolation, 0 uses every core; the '
+                                        'result does not depend on it (default: 1)')
+
+
+def _add_file_format_argument(group_output):
+    group_output.add_argument('-ff', '--file-format', choices=FORMATS, default='text',
+                              help='File format: text, gzip = compressed text, npy, npz = compressed numpy, '
+                                   'hdf5 = chunked and compressed HDF5, needs h5py (default: text)')
+
+
+def _build_parser():
+    # Setup parser
+    parser = argparse.ArgumentParser(prog='plot_chgcar', description='2d projection of CHGCAR')
+
+    # Add options
+    _add_input_arguments(parser)
+    parser.add_argument('-b', '--batch', nargs='?', type=str,
+                        help='JSON spec file listing planes to render from a single read of the CHG file. Each '
+                             'entry sets options by their long names (e.g. x_axis, center_atom, x_res, format) '
+                             'on top of the command line ones; spin_channel may be a list, and output names the '
+                             'files, e.g. "chg_%%(spin_channel)s_xz". Planes are rendered --jobs at a time '
+                             '(default: None)')
+
+    # Set default commands
+    # Coordinate system options
+    group_coord = parser.add_argument_group('coordinate system')
+    _add_center_arguments(group_coord)
+
     # Interpolation options
     group_interpolate = parser.add_argument_group('interpolation')
     group_interpolate.add_argument('-xrep', '--x-repeat', nargs='?', type=float, default=1,
@@ -43,94 +100,492 @@ def _build_parser():
                                    help='Resolution of the x-axis (default: 100)')
     group_interpolate.add_argument('-yres', '--y-res', nargs='?', type=int, default=100,
                                    help='Resolution of the y-axis (default: 100)')
+    _add_method_arguments(group_interpolate)
+    group_interpolate.add_argument('-sc', '--stencil-cache', nargs='?', type=int, default=CACHE_BYTES // 2 ** 20,
+                                   help='Megabytes of interpolation stencils kept for the channels of a batch '
+                                        'entry, per entry rendered at a time (default: %d)' % (CACHE_BYTES // 2 ** 20))
 
     # Output parameters
     group_output = parser.add_argument_group('output')
-    group_output.add_argument('-fmt', '--format', choices=['xyz', 'matrix', 'image'], default='xyz',
-                              help='Output format: xyz = columns of x,y,z data, matrix = raw density data '
-                                   '(default: xyz)')
+    group_output.add_argument('-fmt', '--format', choices=['xyz', 'matrix', 'image', 'raster'], default='xyz',
+                              help='Output format: xyz = columns of x,y,z data, matrix = raw density data, '
+                                   'image = contour plot, raster = colormapped PNG of the density with contour '
+                                   'lines and atoms in the plane (default: xyz)')
+    _add_file_format_argument(group_output)
     group_output.add_argument('-gz', '--gzip', action='store_true',
-                              help='Enables gzip compression of the output (default: disabled)')
+                              help='Enables gzip compression of the output, same as --file-format gzip '
+                                   '(default: disabled)')
     group_output.add_argument('-o', '--out', nargs='?', type=str, default='density.png',
                               help='Image output file (default: density.png')
     group_output.add_argument('-c', '--contour', nargs='?', type=int, default=10,
                               help='Number of contour lines (default: 10)')
+    group_output.add_argument('-cm', '--colormap', nargs='?', type=str, default='viridis',
+                              help='matplotlib colormap of raster images (default: viridis)')
+    group_output.add_argument('-ad', '--atom-depth', nargs='?', type=float, default=0.5,
+                              help='Atoms, and their periodic images, closer than this to the plane (in Angstrom) '
+                                   'are listed and marked on raster images (default: 0.5)')
+    group_output.add_argument('-na', '--no-atoms', action='store_true',
+                              help='Do not mark the atoms in the plane on raster images (default: disabled)')
     return parser
 
 
-def main():
-    # Set default variables
-    options = dict(
-        spin_channel='total',
-        center_cartesian=[0., 0., 0.],
-        x_axis=[1., 0., 0.],
-        y_axis=[0., 0., 1.],
-        x_repeat=1,  # approximate number of unit cells to interpolate
-        y_repeat=1,  # approximate number of unit cells to interpolate
-        x_res=500,  # points to interpolate
-        y_res=500,  # points to interpolate
-        format='xyz',
-    )
-    options.update(**vars(_build_parser().parse_args()))
+def _build_line_parser():
+    # Setup parser
+    parser = argparse.ArgumentParser(prog='density1d', description='Density of CHGCAR along a line')
+
+    # Add options
+    _add_input_arguments(parser)
+
+    # Line options
+    group_line = parser.add_argument_group('line')
+    group_line.add_argument('-ba', '--begin-atom', nargs='?', type=int,
+                            help='Atom at the beginning of the line (default: None)')
+    group_line.add_argument('-br', '--begin-direct', nargs=3, type=float, default=[0., 0., 0.],
+                            help='Direct (fractional) coordinate for the beginning of the line (default: 0 0 0)')
+    group_line.add_argument('-ea', '--end-atom', nargs='?', type=int,
+                            help='Atom at the end of the line (default: None)')
+    group_line.add_argument('-er', '--end-direct', nargs=3, type=float, default=[0., 0., 1.],
+                            help='Direct (fractional) coordinate for the end of the line (default: 0 0 1)')
+
+    # Interpolation options
+    group_interpolate = parser.add_argument_group('interpolation')
+    group_interpolate.add_argument('-res', '--res', nargs='?', type=int, default=200,
+                                   help='Number of points along the line (default: 200)')
+    _add_method_arguments(group_interpolate)
+    group_interpolate.add_argument('-sc', '--stencil-cache', nargs='?', type=int, default=CACHE_BYTES // 2 ** 20,
+                                   help='Megabytes of interpolation stencils kept for the channels of a batch '
+                                        'entry, per entry rendered at a time (default: %d)' % (CACHE_BYTES // 2 ** 20))
+
+    # Output parameters
+    group_output = parser.add_argument_group('output')
+    _add_file_format_argument(group_output)
+    return parser
+
+
+def _build_volume_parser():
+    # Setup parser
+    parser = argparse.ArgumentParser(prog='density3d', description='Density of CHGCAR on a rotated sub-volume')
+
+    # Add options
+    _add_input_arguments(parser)
+
+    # Coordinate system options, the z-axis is normal to the x and y axes
+    group_coord = parser.add_argument_group('coordinate system')
+    _add_center_arguments(group_coord)
+
+    # Interpolation options
+    group_interpolate = parser.add_argument_group('interpolation')
+    group_interpolate.add_argument('-rep', '--repeat', nargs=3, type=float, default=[1., 1., 1.],
+                                   help='Approximate number of repetitions of the cell along x, y and z '
+                                        '(default: 1 1 1)')
+    group_interpolate.add_argument('-res', '--res', nargs=3, type=int, default=[50, 50, 50],
+                                   help='Resolution along x, y and z (default: 50 50 50)')
+    _add_method_arguments(group_interpolate)
+    group_interpolate.add_argument('-sc', '--stencil-cache', nargs='?', type=int, default=CACHE_BYTES // 2 ** 20,
+                                   help='Megabytes of interpolation stencils kept for the channels of a batch '
+                                        'entry, per entry rendered at a time (default: %d)' % (CACHE_BYTES // 2 ** 20))
+
+    # Output parameters
+    group_output = parser.add_argument_group('output')
+    group_output.add_argument('-fmt', '--format', choices=['xyz', 'matrix'], default='xyz',
+                              help='Output format: xyz = columns of x,y,z,density data, matrix = raw density '
+                                   'data, in npy format unless --file-format is npz or hdf5 (default: xyz)')
+    _add_file_format_argument(group_output)
+    return parser
+
+
+def _build_average_parser():
+    # Setup parser
+    parser = argparse.ArgumentParser(prog='densityavg',
+                                     description='Planar and macroscopic averages of CHGCAR or LOCPOT')
+
+    # Add options
+    _add_input_arguments(parser)
+    parser.add_argument('-p', '--potential', action='store_true',
+                        help='The file holds a potential (LOCPOT), whose values are not divided by the cell '
+                             'volume (default: disabled)')
+
+    # Averaging options
+    group_average = parser.add_argument_group('averaging')
+    group_average.add_argument('-a', '--axis', choices=[0, 1, 2], type=int, default=2,
+                               help='Lattice vector along which the planar average is taken (default: 2)')
+    group_average.add_argument('-w', '--width', nargs='*', type=float, default=[],
+                               help='Window widths in Angstrom of the macroscopic average, applied in turn, '
+                                    'e.g. the periods of both materials of an interface (default: None)')
+
+    # Output parameters
+    group_output = parser.add_argument_group('output')
+    _add_file_format_argument(group_output)
+    return parser
+
+
+def _build_integrate_parser():
+    # Setup parser
+    parser = argparse.ArgumentParser(prog='densityint',
+                                     description='Charge and magnetic moment around each atom of CHGCAR')
+
+    # Add options
+    parser.add_argument('filenames', type=str, nargs='*', default=['CHGCAR'],
+                        help='CHG files on the same grid, integrated with the same index (default: CHGCAR)')
+    parser.add_argument('-nc', '--no-cache', action='store_true',
+                        help='Do not use the parse cache (default: cache enabled)')
+
+    # Integration options
+    group_integrate = parser.add_argument_group('integration')
+    group_integrate.add_argument('-r', '--radius', nargs='*', type=float,
+                                 help='Radius in Angstrom of the sphere around every atom, or one radius per atom; '
+                                      'without radii the Voronoi cells of the atoms are used (default: None)')
+    group_integrate.add_argument('-mag', '--magnetization', action='store_true',
+                                 help='Also integrate the magnetization of spin polarized runs (default: disabled)')
+    group_integrate.add_argument('-j', '--jobs', nargs='?', type=int, default=1,
+                                 help='Number of threads used to find the Voronoi cells, 0 uses every core '
+                                      '(default: 1)')
 
-    chg = Chgcar.from_file(options['filename'])
-    structure = chg.structure
-    rprim = chg.structure.lattice.matrix
+    # Output parameters
+    group_output = parser.add_argument_group('output')
+    _add_file_format_argument(group_output)
+    return parser
+
+
+def _spin_channel(structure, grids, channel, dtype, volume=None, overwrite=False):
+    """
+    Density of a spin channel from the grid blocks of the CHG file, which hold the density times volume.
+    With overwrite, the result may be computed in place of a grid block.
+    """
+    if volume is None:
+        volume = structure.volume
+
+    # The grids may be read-only memory maps, so unless allowed each component is computed into a new array
+    def result(block):
+        grid = grids[block]
+        return grid if overwrite and grid.dtype == dtype and grid.flags.writeable else None
+
+    if channel == 'total':
+        data = numpy.divide(grids['total'], volume, out=result('total'), dtype=dtype)
+    if channel == 'up':
+        data = numpy.add(grids['total'], grids['diff'], out=result('total'), dtype=dtype)
+        data /= 2 * volume
+    if channel == 'down':
+        data = numpy.subtract(grids['total'], grids['diff'], out=result('total'), dtype=dtype)
+        data /= 2 * volume
+    if channel == 'polarization':
+        data = numpy.divide(grids['diff'], volume, out=result('diff'), dtype=dtype)
+    return data
+
+
+def _read_grids(options, blocks):
+    """ Structure and grid blocks of the CHG file, minus those of the files to subtract """
+    if not options['subtract']:
+        return read_chgcar(options['filename'], blocks, cache=not options['no_cache'])
+    filenames = [options['filename']] + options['subtract']
+    coefficients = [1.] + [-1.] * len(options['subtract'])
+    print('Subtracting the density of %s from %s' % (', '.join(options['subtract']), options['filename']))
+    return sum_chgcar(filenames, coefficients, blocks, cache=not options['no_cache'])
+
+
+def _read_density(options):
+    """ Read the CHG file and return the structure and the requested density component """
+    channel = options['spin_channel']
+    structure, grids = _read_grids(options, SPIN_BLOCKS[channel])
+    dtype = numpy.float32 if options['single_precision'] else float
+    # Potentials are stored as is
+    volume = 1. if options.get('potential') else None
+    # Summed grids are not used again, so the density replaces them
+    return structure, _spin_channel(structure, grids, channel, dtype, volume, overwrite=bool(options['subtract']))
+
+
+def _fmt(options):
+    """ Number format of text output, enough digits for the precision of the density """
+    return '%.8e' if options['single_precision'] else '%.18e'
+
+
+def _center(options, structure):
+    """ Direct coordinates of the center chosen on the command line """
+    rprim = structure.lattice.matrix
     # Decide where to obtain center from
     # Cartesian option set
     center = options['center_direct']
-    
+
     if options['center_cartesian'] is not None:
         # Convert from cartesian to reduced coordinates
         center = numpy.linalg.solve(rprim, options['center_cartesian']).tolist()
-    
+
     # Atomic option is set
     if options['center_atom'] is not None:
         # Convert from atom number to reduced coordinates
         center = structure[options['center_atom']].frac_coords.tolist()
-    
+    return center
+
+
+def _plane(options, structure, data, sampler=None):
+    """
+    Interpolate data on the plane given by options and write it to the files named
+    after options['output']. Returns the report printed for the plane.
+    """
+    rprim = structure.lattice.matrix
+    center = _center(options, structure)
+
     plane = numpy.array([options['x_axis'], options['y_axis']], dtype=float)
     repeat = [options['x_repeat'], options['y_repeat']]
     res = [options['x_res'], options['y_res']]
-    data = 0
-    if options['spin_channel'] == 'total':
-        data = chg.data['total']
-    if options['spin_channel'] == 'up':
-        data = chg.spin_data[Spin.up]
-    if options['spin_channel'] == 'down':
-        data = chg.spin_data[Spin.down]
-    if options['spin_channel'] == 'polarization':
-        data = chg.spin_data[Spin.up] - chg.spin_data[Spin.down]
-    
-    data /= structure.volume
-    
+
     cs = plane_to_cs(plane)
-    posinplane = numpy.dot(cs, numpy.dot(structure.frac_coords - center, rprim).T).T
-    print('Atom positions in plane:')
-    for i, pos in enumerate(posinplane):
-        print('  %s: %f %f (z = %f)' % (structure[i].specie, pos[0], pos[1], pos[2]))
-    
+
+    file_format = options['file_format']
+    if options['gzip'] and file_format == 'text':
+        file_format = 'gzip'
+    matrix = '%s.mat' % options['output']
+    out = None
+    if options['format'] == 'matrix' and file_format == 'npy':
+        # Interpolate straight into the output file
+        out = numpy.lib.format.open_memmap(output_filename(matrix, 'npy'), mode='w+', dtype=data.dtype,
+                                           shape=tuple(res))
+
     # Interpolate
-    x, y, z = interpolate_plane(data, rprim, plane=plane, center=center, dim=repeat, res=res)
-    print('Cell density:\n  minimum: %f\n  maximum: %f' % (data.min(), data.max()))
-    print('In-plane density:\n  minimum: %f\n  maximum: %f' % (z.min(), z.max()))
-    print('Note: PAW calculations may contain negative values for the pseudo-density in the core regions.')
-    
-    suffix = '.gz' if options['gzip'] else ''
-    
+    if sampler is None:
+        x, y, z = interpolate_plane(data, rprim, plane=plane, center=center, dim=repeat, res=res,
+                                    method=options['method'], chunk=options['chunk'],
+                                    workers=options['jobs'], out=out)
+    else:
+        x, y, z = sampler.x, sampler.y, sampler(data, out=out)
+
+    # Atoms and periodic images in the plotted window
+    sites, shifts, images = plane_sites(rprim, structure.frac_coords, cs, center,
+                                        (x.min(), x.max(), y.min(), y.max()), options['atom_depth'])
+    report = ['Atom positions in plane (within %g of the plane):' % options['atom_depth']]
+    for site, shift, pos in zip(sites, shifts, images):
+        report.append('  %s [%d %d %d]: %f %f (z = %f)' % ((structure[site].specie,) + tuple(shift) + tuple(pos)))
+    report.append('Cell density:\n  minimum: %f\n  maximum: %f' % (data.min(), data.max()))
+    report.append('In-plane density:\n  minimum: %f\n  maximum: %f' % (z.min(), z.max()))
+    report.append('Note: PAW calculations may contain negative values for the pseudo-density in the core regions.')
+
     if options['format'] == 'xyz':
         out = numpy.array([x.flatten(), y.flatten(), z.flatten()]).T
-        with open('chg_%s_in_plane.csv%s' % (options['spin_channel'], suffix), 'w+') as f:
-            numpy.savetxt(f, out, delimiter=',', header=' X, Y, Z')
-            
+        write_array('%s.csv' % options['output'], out, ' X, Y, Z', file_format, fmt=_fmt(options),
+                    names=['X', 'Y', 'Z'])
+
     if options['format'] == 'matrix':
-        with open('chg_%s_in_plane.mat%s' % (options['spin_channel'], suffix), 'w+') as f:
-            numpy.savetxt(f, z, delimiter=' ', header=' Z matrix')
+        if out is None:
+            write_array(matrix, z, ' Z matrix', file_format, fmt=_fmt(options), delimiter=' ')
+        else:
+            out.flush()
 
     if options['format'] == 'image':
         import matplotlib
         matplotlib.use('Agg')
         import matplotlib.pyplot as plt
-        fig = plt.figure()
-        plt.contour(x, y, z, options['contour'], colors='k')
-        fig.savefig(options['out'])
+        with _PLOT_LOCK:
+            fig = plt.figure()
+            plt.contour(x, y, z, options['contour'], colors='k')
+            fig.savefig(options['out'])
+            plt.close(fig)
+
+    if options['format'] == 'raster':
+        atoms = [] if options['no_atoms'] else images[:, :2]
+        pixels, palette = raster_plane(z, x, y, cmap=options['colormap'], contours=options['contour'], atoms=atoms)
+        write_png(options['out'], pixels, palette)
+    return '\n'.join(report)
+
+
+def _read_batch(options):
+    """ Options of every plane of the batch spec file, one entry per plane and spin channel """
+    with open(options['batch']) as f:
+        spec = json.load(f)
+    if isinstance(spec, dict):
+        spec = [spec]
+
+    slices = []
+    for index, entry in enumerate(spec):
+        entry = dict((key.replace('-', '_'), value) for key, value in entry.items())
+        unknown = [key for key in entry if key not in options and key != 'output']
+        if unknown:
+            raise Exception('Unknown options in %s: %s' % (options['batch'], ', '.join(unknown)))
+        channels = entry.pop('spin_channel', options['spin_channel'])
+        if not isinstance(channels, list):
+            channels = [channels]
+        for channel in channels:
+            if channel not in SPIN_BLOCKS:
+                raise Exception('Unknown spin channel in %s: %s' % (options['batch'], channel))
+
+        base = dict(options, index=index)
+        if any(key in entry for key in _CENTER_OPTIONS):
+            # The center of the entry replaces the one from the command line
+            base.update(center_atom=None, center_cartesian=None, center_direct=None)
+        base.update(entry)
+        output = base.get('output', 'chg_%(spin_channel)s_in_plane_%(index)d')
+        slices.append([])
+        for channel in channels:
+            plane = dict(base, spin_channel=channel)
+            plane['output'] = output % plane
+            if 'out' not in entry:
+                plane['out'] = '%s.png' % plane['output']
+            slices[-1].append(plane)
+    return slices
+
+
+def _batch(options):
+    """ Render every plane of the batch spec file from a single read of the CHG file """
+    slices = _read_batch(options)
+    channels = set(plane['spin_channel'] for planes in slices for plane in planes)
+    blocks = sorted(set(block for channel in channels for block in SPIN_BLOCKS[channel]))
+    structure, grids = _read_grids(options, blocks)
+    dtype = numpy.float32 if options['single_precision'] else float
+    densities = dict((channel, _spin_channel(structure, grids, channel, dtype)) for channel in channels)
+    shape = densities[next(iter(channels))].shape
+
+    jobs = options['jobs'] if options['jobs'] > 0 else cpu_count()
+    # Entries are rendered at the same time by several jobs; a single entry shares its tiles out instead
+    workers = 1 if len(slices) > 1 else jobs
+
+    # The planes of an entry share their geometry and stencil, which are computed once for all its channels and
+    # kept within the stencil cache of the entry
+    def render(planes):
+        first = planes[0]
+        sampler = PlaneSampler(shape, structure.lattice.matrix,
+                               plane=[first['x_axis'], first['y_axis']], center=_center(first, structure),
+                               dim=[first['x_repeat'], first['y_repeat']], res=[first['x_res'], first['y_res']],
+                               method=first['method'], dtype=dtype, chunk=first['chunk'], workers=workers,
+                               cache_bytes=first['stencil_cache'] * 2 ** 20)
+        return ['%s\n%s' % (plane['output'], _plane(plane, structure, densities[plane['spin_channel']], sampler))
+                for plane in planes]
+
+    if jobs == 1 or len(slices) < 2:
+        reports = map(render, slices)
+    else:
+        pool = ThreadPool(min(jobs, len(slices)))
+        try:
+            reports = pool.map(render, slices)
+        finally:
+            pool.close()
+            pool.join()
+    for report in reports:
+        print('\n'.join(report))
+
+
+def main(args=None):
+    # Set default variables
+    options = dict(
+        spin_channel='total',
+        center_cartesian=[0., 0., 0.],
+        x_axis=[1., 0., 0.],
+        y_axis=[0., 0., 1.],
+        x_repeat=1,  # approximate number of unit cells to interpolate
+        y_repeat=1,  # approximate number of unit cells to interpolate
+        x_res=500,  # points to interpolate
+        y_res=500,  # points to interpolate
+        method='linear',
+        format='xyz',
+    )
+    options.update(**vars(_build_parser().parse_args(args)))
+    if options['batch'] is not None:
+        _batch(options)
+        return
+
+    structure, data = _read_density(options)
+    options['output'] = 'chg_%s_in_plane' % options['spin_channel']
+    print(_plane(options, structure, data))
+
+
+def main_line(args=None):
+    options = vars(_build_line_parser().parse_args(args))
+
+    structure, data = _read_density(options)
+    begin = options['begin_direct']
+    if options['begin_atom'] is not None:
+        begin = structure[options['begin_atom']].frac_coords
+    end = options['end_direct']
+    if options['end_atom'] is not None:
+        end = structure[options['end_atom']].frac_coords
+    print('Line from %s to %s (direct coordinates)' % (numpy.array(begin), numpy.array(end)))
+
+    # Interpolate
+    distance, line = interpolate_line(data, structure.lattice.matrix, start=begin, end=end, res=options['res'],
+                                      method=options['method'], chunk=options['chunk'],
+                                      workers=options['jobs'])
+    print('Line density:\n  minimum: %f\n  maximum: %f' % (line.min(), line.max()))
+
+    out = numpy.array([distance, line]).T
+    write_array('chg_%s_on_line.csv' % options['spin_channel'], out, ' distance, density', options['file_format'],
+                fmt=_fmt(options), names=['distance', 'density'])
+
+
+def main_volume(args=None):
+    options = vars(_build_volume_parser().parse_args(args))
+
+    structure, data = _read_density(options)
+    center = _center(options, structure)
+    plane = numpy.array([options['x_axis'], options['y_axis']], dtype=float)
+
+    # Interpolate
+    x, y, z, volume = interpolate_volume(data, structure.lattice.matrix, plane=plane, center=center,
+                                         dim=options['repeat'], res=options['res'],
+                                         method=options['method'], chunk=options['chunk'],
+                                         workers=options['jobs'])
+    print('In-volume density:\n  minimum: %f\n  maximum: %f' % (volume.min(), volume.max()))
+
+    if options['format'] == 'xyz':
+        out = numpy.array([x.flatten(), y.flatten(), z.flatten(), volume.flatten()]).T
+        write_array('chg_%s_in_volume.csv' % options['spin_channel'], out, ' X, Y, Z, density',
+                    options['file_format'], fmt=_fmt(options), names=['X', 'Y', 'Z', 'density'])
+
+    if options['format'] == 'matrix':
+        # Text cannot hold a 3d array
+        file_format = options['file_format'] if options['file_format'] in ('npz', 'hdf5') else 'npy'
+        write_array('chg_%s_in_volume.npy' % options['spin_channel'], volume, ' density', file_format)
+
+
+def main_average(args=None):
+    options = vars(_build_average_parser().parse_args(args))
+
+    structure, data = _read_density(options)
+    axis = options['axis']
+    length = plane_spacing(structure.lattice.matrix, axis)
+    profile = planar_average(data, axis)
+    distance = numpy.arange(len(profile)) * length / len(profile)
+    print('Planar average along lattice vector %d (plane spacing %f):\n  minimum: %f\n  maximum: %f'
+          % (axis, length, profile.min(), profile.max()))
+
+    columns = [distance, profile]
+    names = ['distance', 'planar']
+    if options['width']:
+        macroscopic = macroscopic_average(profile, length, options['width'])
+        print('Macroscopic average over %s Angstrom:\n  minimum: %f\n  maximum: %f'
+              % (', '.join('%g' % w for w in options['width']), macroscopic.min(), macroscopic.max()))
+        columns.append(macroscopic)
+        names.append('macroscopic')
+
+    write_array('chg_%s_average.csv' % options['spin_channel'], numpy.array(columns).T, ' ' + ', '.join(names),
+                options['file_format'], fmt=_fmt(options), names=names)
+
+
+def main_integrate(args=None):
+    options = vars(_build_integrate_parser().parse_args(args))
+    radii = options['radius'] or None
+    if radii is not None and len(radii) == 1:
+        radii = radii[0]
+    blocks = ('total', 'diff') if options['magnetization'] else ('total',)
+
+    index = None
+    for filename in options['filenames']:
+        structure, grids = read_chgcar(filename, blocks, cache=not options['no_cache'])
+        shape = grids['total'].shape
+        if index is None or index.shape != shape or not numpy.allclose(index.cell, structure.lattice.matrix) \
+                or not numpy.allclose(index.frac_coords, structure.frac_coords):
+            index = SiteIndex(shape, structure.lattice.matrix, structure.frac_coords, radii,
+                              workers=options['jobs'])
+
+        # The grids hold the density times the cell volume
+        columns = [numpy.arange(len(structure)), index.integrate(grids['total']) / structure.volume]
+        names = ['site', 'charge']
+        if options['magnetization']:
+            columns.append(index.integrate(grids['diff']) / structure.volume)
+            names.append('moment')
+        columns.append(index.volumes)
+        names.append('volume')
+
+        print('%s:' % filename)
+        print('  site  ' + ''.join('%12s' % name for name in names[1:]))
+        for i, row in enumerate(numpy.array(columns).T):
+            print('  %-4s  ' % structure[i].specie + ''.join('%12.6f' % value for value in row[1:]))
+        write_array('%s_integrated.csv' % filename, numpy.array(columns).T, ' ' + ', '.join(names),
+                    options['file_format'], names=names)
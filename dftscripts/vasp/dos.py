@@ -1,39 +1,90 @@
 #!/usr/bin/env python
 from __future__ import print_function
 
+import argparse
 import numpy
 from pymatgen.io.vaspio.vasp_output import Vasprun
 from pymatgen.electronic_structure.core import Spin
+from pymatgen.electronic_structure.dos import Dos
 
+from ..util.cache import open_cache
+from ..util.output import FORMATS, write_array
 
-def main(vasprun='vasprun.xml', outfile='dos.csv'):
+
+def _read_dos(vasprun, cache=None):
+    """ Arrays of the total DOS, from the parse cache if vasprun.xml was read before """
+    arrays = cache.load(vasprun, 'dos') if cache else None
+    if arrays is None:
+        run = Vasprun(vasprun)
+        dos = run.complete_dos
+        arrays = dict(
+            kpoints=numpy.array(run.kpoints.kpts, dtype=float),
+            efermi=numpy.array(dos.efermi),
+            energies=numpy.array(dos.energies),
+            up=numpy.array(dos.densities[Spin.up]),
+        )
+        if run.is_spin:
+            arrays['down'] = numpy.array(dos.densities[Spin.down])
+        if cache:
+            cache.store(vasprun, 'dos', arrays)
+    return arrays
+
+
+def _build_parser():
+    # Setup parser
+    parser = argparse.ArgumentParser(prog='dos', description='Total or spin polarized DOS of a vasp calculation')
+
+    # Add options
+    parser.add_argument('vasprun', type=str, nargs='?', default='vasprun.xml',
+                        help='The vasprun.xml file (default: vasprun.xml)')
+    parser.add_argument('-o', '--outfile', type=str, default='dos.csv',
+                        help='Output file name, the extension follows the file format (default: dos.csv)')
+    parser.add_argument('-nc', '--no-cache', action='store_true',
+                        help='Do not use the parse cache (default: cache enabled)')
+    parser.add_argument('-ff', '--file-format', choices=FORMATS, default='text',
+                        help='File format: text, gzip = compressed text, npy, npz = compressed numpy, '
+                             'hdf5 = chunked and compressed HDF5, needs h5py (default: text)')
+
+    return parser
+
+
+def write_dos(vasprun='vasprun.xml', outfile='dos.csv', cache=True, file_format='text'):
     print('NOTE: This program will only convert the total or spin polarized DOS.')
     print('Reading "%s"' % vasprun)
-    run = Vasprun(vasprun)
-    if run.is_spin:
+    arrays = _read_dos(vasprun, open_cache(cache))
+    is_spin = 'down' in arrays
+    if is_spin:
         print('Extracting spin polarized DOS')
     else:
         print('Extracting total DOS')
 
-    has_gamma = (numpy.linalg.norm(run.kpoints.kpts, axis=1) < 0.00001).any()
+    has_gamma = (numpy.linalg.norm(arrays['kpoints'], axis=1) < 0.00001).any()
     if not has_gamma:
         print('WARNING: KPOINTS should include the Gamma point for improved accuracy.')
         print('         You may fix this by using a zone centered KPOINTS file, or')
         print('         if you are using the KGAMMA flag in your INCAR, set it to .TRUE.')
     
-    dos = run.complete_dos
-    nedos = len(run.complete_dos.energies)
+    densities = {Spin.up: arrays['up']}
+    if is_spin:
+        densities[Spin.down] = arrays['down']
+    dos = Dos(float(arrays['efermi']), arrays['energies'], densities)
+    nedos = len(dos.energies)
 
-    print('Fermi energy is %f. Shifting the energies so Efermi = 0.' % run.efermi)
+    print('Fermi energy is %f. Shifting the energies so Efermi = 0.' % dos.efermi)
     print('Gap might be: %f' % dos.get_interpolated_gap()[0])
     print(' -> You should verify this manually!')
-    dos_array = numpy.zeros([nedos, run.is_spin + 2])
+    dos_array = numpy.zeros([nedos, is_spin + 2])
     dos_array[:, 0] = dos.energies[:] - dos.efermi
     dos_array[:, 1] = dos.densities[Spin.up]
-    if run.is_spin:
+    if is_spin:
         dos_array[:, 2] = dos.densities[Spin.down]
     
-    header = ' energy, spin up, spin down' if run.is_spin else u' energy, dos'
-    with open(outfile, 'w+') as f:
-        numpy.savetxt(f, dos_array, delimiter=',', header=header)
+    header = ' energy, spin up, spin down' if is_spin else u' energy, dos'
+    names = ['energy', 'up', 'down'] if is_spin else ['energy', 'dos']
+    outfile = write_array(outfile, dos_array, header, file_format, names=names)
     print('Written file as "%s"' % outfile)
+
+
+def main(args=None):
+    options = _build_parser().parse_args(args)
+    write_dos(options.vasprun, options.outfile, not options.no_cache, options.file_format)
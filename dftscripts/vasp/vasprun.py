@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import gzip
+import numpy
+
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+__all__ = [
+    'read_vasprun',
+]
+
+# Sections of vasprun.xml that are kept in memory until they are parsed. Every
+# other element, e.g. the DOS and the projections, is dropped once read.
+_SECTIONS = ('kpoints', 'atominfo', 'structure', 'eigenvalues')
+
+
+def _varray(elem):
+    """ Values of a varray element as a 2d array """
+    return numpy.array([[float(x) for x in v.text.split()] for v in elem.findall('v')])
+
+
+def _structure(elem, data):
+    """ Lattice and positions of a structure element """
+    for varray in elem.find('crystal').findall('varray'):
+        if varray.get('name') == 'basis':
+            data['lattice'] = _varray(varray)
+        if varray.get('name') == 'rec_basis':
+            data['rec_lattice'] = _varray(varray)
+    for varray in elem.findall('varray'):
+        if varray.get('name') == 'positions':
+            data['frac_coords'] = _varray(varray)
+
+
+def _eigenvalues(elem, data):
+    """ Eigenvalues and occupations, indexed [spin, kpoint, band] """
+    values = []
+    for spin in elem.find('array').find('set').findall('set'):
+        kpoints = spin.findall('set')
+        text = ' '.join(r.text for kpoint in kpoints for r in kpoint.findall('r'))
+        values.append(numpy.fromstring(text, sep=' ').reshape(len(kpoints), -1, 2))
+    values = numpy.array(values)
+    data['eigenvalues'] = values[..., 0]
+    data['occupations'] = values[..., 1]
+
+
+def read_vasprun(filename='vasprun.xml'):
+    """
+    Read the final structure, k-points, eigenvalues, occupations and Fermi level of
+    a vasprun.xml file (gzipped if its name ends with .gz), without building the
+    whole document: elements are parsed as they are read and removed from the tree
+    right after, so the memory used does not depend on the size of the DOS or the
+    projections. Returns a dictionary of arrays:
+
+      lattice, rec_lattice: rows are the lattice vectors and the reciprocal ones
+          (without the factor 2 pi) of the final structure
+      species, frac_coords: element and direct coordinates of every site
+      kpoints, weights: k-points in direct coordinates and their weights
+      divisions: k-points of every line segment, for line mode KPOINTS only
+      eigenvalues, occupations: indexed [spin, kpoint, band]
+      efermi: the Fermi level
+    """
+    data = dict()
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as f:
+        # Elements being read, from the root, and how many of them are sections
+        # to keep or projections to drop
+        stack = []
+        sections = projected = 0
+        for event, elem in iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                sections += elem.tag in _SECTIONS
+                projected += elem.tag == 'projected'
+                continue
+            stack.pop()
+            sections -= elem.tag in _SECTIONS
+            projected -= elem.tag == 'projected'
+            parent = stack[-1].tag if stack else None
+            tag = elem.tag
+
+            if tag == 'varray' and parent == 'kpoints':
+                if elem.get('name') == 'kpointlist':
+                    data['kpoints'] = _varray(elem)
+                if elem.get('name') == 'weights':
+                    data['weights'] = _varray(elem)[:, 0]
+            elif tag == 'i' and parent == 'generation' and elem.get('name') == 'divisions':
+                # Line mode: number of k-points of every segment of the path
+                data['divisions'] = numpy.array(int(elem.text))
+            elif tag == 'array' and parent == 'atominfo' and elem.get('name') == 'atoms':
+                data['species'] = numpy.array([rc.find('c').text.strip() for rc in elem.find('set').findall('rc')])
+            elif tag == 'structure' and parent in ('modeling', 'calculation'):
+                # The last one is the final structure
+                _structure(elem, data)
+            elif tag == 'eigenvalues' and parent == 'calculation':
+                _eigenvalues(elem, data)
+            elif tag == 'i' and parent == 'dos' and elem.get('name') == 'efermi':
+                data['efermi'] = numpy.array(float(elem.text))
+
+            # Drop the element unless it is part of a section still to be parsed
+            if stack and (not sections or projected):
+                stack[-1].remove(elem)
+    return data
@@ -0,0 +1,114 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from subprocess import CalledProcessError
+
+from dftscripts.util.runner import Progress, run_monitored
+
+
+# Stand-in for VASP: writes the files the runner follows and what a real run
+# prints, as a python script run in the run directory
+_STUB = '''
+import sys, time
+mode = sys.argv[1]
+open('OUTCAR', 'w').write(' NKPTS =    120   k-points in BZ\\n')
+open('OSZICAR', 'w').close()
+if mode == 'ok':
+    for i in range(5):
+        open('OSZICAR', 'a').write('DAV:   %d   -0.1E+02\\n' % (i + 1))
+        time.sleep(0.02)
+    open('OSZICAR', 'a').write('   1 F= -.1E+02 E0= -.1E+02\\n')
+elif mode == 'fail':
+    sys.exit(3)
+elif mode == 'fatal':
+    print(' VERY BAD NEWS! internal error in subroutine IBZKPT')
+    sys.stdout.flush()
+    time.sleep(30)
+elif mode == 'stop':
+    print(' ZBRENT: fatal error in bracketing')
+elif mode == 'stall':
+    open('OSZICAR', 'a').write('DAV:   1   -0.1E+02\\n')
+    time.sleep(30)
+'''
+
+
+# Progress whose first update reads nothing, as when the command writes its
+# last lines and exits between two checks of the runner
+class _LateProgress(Progress):
+    def __init__(self, *args, **kwargs):
+        super(_LateProgress, self).__init__(*args, **kwargs)
+        self.skip = 1
+
+    def update(self):
+        if self.skip:
+            self.skip -= 1
+            return False
+        return super(_LateProgress, self).update()
+
+
+class RunMonitoredTest(unittest.TestCase):
+    def setUp(self):
+        self.rundir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.rundir)
+
+    def run_stub(self, mode, **kwargs):
+        with open(os.path.join(self.rundir, 'vasp.out'), 'w') as out:
+            return run_monitored([sys.executable, '-c', _STUB, mode], cwd=self.rundir, stdout=out,
+                                 interval=0.05, **kwargs)
+
+    def test_progress(self):
+        progress = Progress(directory=self.rundir)
+        self.assertEqual(self.run_stub('ok', progress=progress), 0)
+        self.assertEqual(progress.counts, {'iterations': 5, 'ionic steps': 1})
+        self.assertEqual(progress.values, {'k-points': '120'})
+        self.assertIsNone(progress.error)
+
+    def test_exit_status(self):
+        with self.assertRaises(CalledProcessError) as raised:
+            self.run_stub('fail')
+        self.assertEqual(raised.exception.returncode, 3)
+
+    def test_error_line(self):
+        start = time.time()
+        self.assertRaises(CalledProcessError, self.run_stub, 'fatal')
+        self.assertLess(time.time() - start, 10)
+
+    def test_error_line_exit_zero(self):
+        # Fortran STOP exits with status 0 after the error is printed
+        progress = _LateProgress(directory=self.rundir)
+        with self.assertRaises(CalledProcessError) as raised:
+            with open(os.path.join(self.rundir, 'vasp.out'), 'w') as out:
+                run_monitored([sys.executable, '-c', _STUB, 'stop'], cwd=self.rundir, stdout=out, progress=progress,
+                              interval=1.)
+        self.assertEqual(raised.exception.returncode, 0)
+        self.assertIn('ZBRENT: fatal', progress.error)
+
+    def test_stall(self):
+        start = time.time()
+        self.assertRaises(CalledProcessError, self.run_stub, 'stall', stall=0.5)
+        self.assertLess(time.time() - start, 10)
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertRaises(CalledProcessError, self.run_stub, 'stall', timeout=0.5)
+        self.assertLess(time.time() - start, 10)
+
+    def test_stop(self):
+        stop = threading.Event()
+        timer = threading.Timer(0.5, stop.set)
+        timer.start()
+        try:
+            self.assertRaises(CalledProcessError, self.run_stub, 'stall', stop=stop)
+        finally:
+            timer.cancel()
+        self.assertTrue(stop.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()